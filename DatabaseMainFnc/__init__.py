@@ -0,0 +1,70 @@
+#Price database & efficient frontier portfolio functions
+#
+#The functions are split over submodules which are only imported when one of their
+#names is first used, so importing the package (e.g. in a worker process that only
+#needs net_gains or slices prices) doesn't load cvxpy, pypfopt, yfinance, matplotlib,
+#requests, forex_python or joblib until something needs them:
+#   instrument   - timing spans & metrics sinks
+#   store        - price database maintainance & the parquet price store
+#   matrix       - memory-mapped price matrix & availability index
+#   quality      - incremental data quality scanning
+#   fetch        - price providers & the fetch pipeline, update_db
+#   tax          - net_gains
+#   fx           - FX store & currency conversion
+#   estimation   - return & covariance estimators
+#   optimisation - efficient frontier optimisers
+#   screening    - universe screens & top stock selection
+#   evaluation   - next year evaluation of portfolios
+#   plotting     - performance plots
+#   cache        - result cache of the batch runners
+#   backtest     - portfolio_generate_test, frontier sweeps, walk-forward & grid runs
+#   service      - the local portfolio service
+#   client       - client of the local portfolio service
+import importlib
+
+#the public names of each submodule, all importable from the package itself
+_SUBMODULE_NAMES = {
+    'instrument': ['Span', 'span', 'current_span', 'child_spans', 'traced_parallel', 'timed', 'MemorySink', 
+                   'JsonLinesSink', 'LoggingSink', 'add_metrics_sink', 'remove_metrics_sink', 'metrics_sink'],
+    'store': ['DATE_FORMAT', 'PRICE_DB_DIR', 'connectAndLoadDb', 'getLastEntryDate',
+              'writeDbToExcelFile', 'prettyPrintDate', 'read_store_manifest', 'write_store',
+              'append_to_store', 'load_store', 'migrate_csv_to_store', 'compact_store'],
+    'matrix': ['build_price_matrix', 'PriceMatrix', 'open_price_matrix',
+               'build_availability_index', 'AvailabilityIndex'],
+    'quality': ['QUALITY_FLAGS', 'scan_quality', 'build_quality_index', 'DataQuality',
+                'priceDB_validation'],
+    'fetch': ['getTickers', 'YahooProvider', 'SyntheticProvider', 'fetch_prices',
+              'clear_fetch_checkpoint', 'fetchData', 'update_db', 'cleanCompanyList'],
+    'tax': ['net_gains'],
+    'fx': ['FX_STORE', 'EcbFxProvider', 'ForexPythonProvider', 'SyntheticFxProvider',
+           'update_fx_store', 'load_fx_rates', 'gen_curr_csv', 'EXCHANGE_CURRENCIES',
+           'ticker_currencies', 'FxConverter', 'get_fx_converter', 'load_curr_csv'],
+    'estimation': ['RollingMoments', 'FactorRiskModel', 'factor_risk_model'],
+    'optimisation': ['DEFAULT_RISK_FREE_RATE', 'ParametricFrontier', 'FactorFrontier',
+                     'get_parametric_frontier', 'optimise_portfolio'],
+    'screening': ['screen_universe', 'estimate_top_assets', 'top_n_tickers', 'screen_and_estimate'],
+    'evaluation': ['next_year_prices', 'weighted_values', 'evaluate_portfolios'],
+    'plotting': ['plot_portfolio_returns'],
+    'cache': ['RESULT_CACHE_DIR', 'ResultCache'],
+    'backtest': ['portfolio_generate_test', 'FRONTIER_COLUMNS', 'efficient_frontier_sweep',
+                 'RESULT_COLUMNS', 'walk_forward_schedule', 'run_walk_forward', 'GRID_PARAMETERS',
+                 'grid_configs', 'run_grid'],
+    'service': ['PortfolioService', 'serve'],
+    'client': ['SERVICE_HOST', 'SERVICE_PORT', 'ServiceClient'],
+}
+
+_NAME_TO_SUBMODULE = {name: submodule for submodule, names in _SUBMODULE_NAMES.items() for name in names}
+
+__all__ = list(_NAME_TO_SUBMODULE)
+
+def __getattr__(name):
+    """Imports the submodule defining name on first use"""
+    if name not in _NAME_TO_SUBMODULE:
+        raise AttributeError('module '+repr(__name__)+' has no attribute '+repr(name))
+    value = getattr(importlib.import_module('.'+_NAME_TO_SUBMODULE[name], __name__), name)
+    #later lookups find the name directly rather than through __getattr__
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,536 @@
+#Generating & testing portfolios over windows, frontiers, walk-forward & grid runs
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from pypfopt import expected_returns
+
+from .instrument import current_span, timed, traced_parallel
+from .store import prettyPrintDate
+from .matrix import PriceMatrix, open_price_matrix
+from .quality import _flag_bits
+from .screening import screen_universe, _screen_tickers_indexed, _estimate_risk, top_n_tickers, screen_and_estimate
+from .optimisation import optimise_portfolio, _solve_frontier_points, _grid_solve
+from .estimation import RollingMoments
+from .evaluation import next_year_prices, weighted_values, evaluate_portfolios
+from .cache import ResultCache, _cached
+
+#generates historic performance data
+@timed()
+def portfolio_generate_test(database,startdate,enddate,p_max=400, min_returns=0.01, s_asset=0, asset_len=50, obj_method='SHARPE', target_percent=0.1, silent=True, optimiser='PYPFOPT', risk_model='SAMPLE', n_factors=10, shrinkage=0.0, quality_flags=0, cache=None):
+    """Generates an efficient frontier portfolio from the prices between 
+    startdate & enddate, then tests how it performed over the following year.
+    Parameters
+    ----------
+    database : DataFrame or PriceMatrix
+        The dataframe of stock prices.
+    startdate, enddate : str
+        'YYYY-MM-DD' bounds of the window used to build the portfolio
+    p_max : float
+        Stocks with a latest price above this are dropped as unaffordable
+    min_returns : float
+        Stocks returning less than this over the window are dropped
+    s_asset, asset_len : int
+        Keeps the asset_len best performing stocks starting from rank s_asset,
+        asset_len None keeps all the screened stocks (best with risk_model FACTOR)
+    obj_method : str
+        One of SHARPE, MIN_VOL, RISK, RETURN
+    target_percent : float
+        The target volatility (RISK) or return (RETURN)
+    silent : Boolean
+        False: prints progress & plots the following year's performance
+    optimiser : str
+        PYPFOPT: a new pypfopt EfficientFrontier for each call
+        PARAMETRIC: reuses this process's compiled ParametricFrontier, 
+        warm-started from the last call's weights
+    risk_model : str
+        SAMPLE: the sample covariance of the top stocks
+        FACTOR: a PCA factor model with n_factors factors, optimised in 
+        factored form by a FactorFrontier whichever optimiser is chosen
+    n_factors : int
+        The number of factors of the FACTOR risk model
+    shrinkage : float
+        Between 0 & 1, the shrinkage of the FACTOR risk model's 
+        idiosyncratic variances towards their average, 0 is none
+    quality_flags : int or list
+        Drops stocks with any of these QUALITY_FLAGS in the window, 
+        e.g. ['negative','jump'], see screen_universe
+    cache : ResultCache or Boolean, optional
+        Returns the stored result of an identical earlier run on the same
+        prices, True uses the default ResultCache. Only used when silent
+
+    Returns
+    -------
+    list 
+        [startdate, enddate, expected_returns, volatility, sharpe, 
+        max_returns, min_returns, actual_returns, mean_returns, objective]
+    """
+    if cache is not None and cache is not False and silent == True:
+        params = {'p_max': p_max, 'min_returns': min_returns, 's_asset': s_asset, 'asset_len': asset_len,
+                  'obj_method': obj_method, 'target_percent': target_percent, 'optimiser': optimiser,
+                  'risk_model': risk_model, 'n_factors': n_factors, 'shrinkage': shrinkage, 
+                  'quality_flags': quality_flags}
+        return _cached(cache, 'portfolio_generate_test', database, startdate, enddate, params,
+                       lambda: portfolio_generate_test(database, startdate, enddate, silent=True, **params))
+    if silent == False:
+        print('Running for :'+str(startdate)+' to '+str(enddate))
+    # Screen the universe & estimate mu & S of the top stocks
+    mu, S, top_stocks=screen_and_estimate(database,startdate,enddate,p_max,min_returns,s_asset,asset_len,silent,
+                                          risk_model=risk_model,n_factors=n_factors,shrinkage=shrinkage,
+                                          quality_flags=quality_flags)
+
+    # Optomise for the chosen objective
+    ef, objective_summary=optimise_portfolio(mu, S, obj_method, target_percent, optimiser)
+
+    cl_weights= ef.clean_weights()
+    #print(cl_weights)
+    if silent == False:
+        print("-------------------------------------------------------------")
+        print("Our Benchmark portfolio the S&P 500 has: Volatility  18.1% & Annual Return: 10.6%")
+        ef.portfolio_performance(verbose=True)
+    expected_portfolio_returns=ef.portfolio_performance()[0]
+    volatility=ef.portfolio_performance()[1]
+    r_sharpe=ef.portfolio_performance()[2]
+
+    #create df of the normalised prices of our stocks in the following year
+    df_actual=next_year_prices(database,enddate,top_stocks)
+
+    #our total weighted returns by day & some stats, more can be added in evaluate_portfolios
+    df_weights=pd.DataFrame([cl_weights])
+    df_perf=evaluate_portfolios(df_actual,df_weights).iloc[0]
+    max_returns=df_perf['max_returns']
+    mean_returns=df_perf['mean_returns']
+    min_returns=df_perf['min_returns']
+    actual_returns=df_perf['actual_returns']
+
+    if silent == False:
+        #matplotlib is only imported when there is something to plot
+        from .plotting import plot_portfolio_returns
+        plot_portfolio_returns(weighted_values(df_actual,df_weights).iloc[:,0], expected_portfolio_returns)
+        print("-------------------------------------------------------------")
+        print("Our portfolio performed at : " + str(f'{actual_returns*100:.{1}f}')+"%")
+        print("Max : " + str(f'{max_returns*100:.{1}f}')+"%, "
+             +"Min : " + str(f'{min_returns*100:.{1}f}')+"%, "
+             +"Mean : " + str(f'{mean_returns*100:.{1}f}')+"%")
+
+    return [pd.to_datetime(startdate), pd.to_datetime(enddate), expected_portfolio_returns, volatility, r_sharpe, max_returns, min_returns, actual_returns,mean_returns, objective_summary]
+
+
+#Efficient frontier functions
+
+#column names of the frontier points returned by efficient_frontier_sweep
+FRONTIER_COLUMNS = ['target', 'weights', 'expected_returns', 'volatility', 'sharpe', 'feasible', 'error']
+
+@timed()
+def efficient_frontier_sweep(database, startdate, enddate, targets, target_type='RISK', p_max=400, min_returns=0.01, s_asset=0, asset_len=50, n_jobs=1, risk_model='SAMPLE', n_factors=10, shrinkage=0.0, quality_flags=0, cache=None):
+    """Solves a whole efficient frontier for one window, the screening & 
+    estimation are done once & every target is solved against the same 
+    compiled problem.
+    Parameters
+    ----------
+    database : DataFrame or PriceMatrix
+        The dataframe of stock prices.
+    startdate, enddate : str
+        'YYYY-MM-DD' bounds of the window used to build the portfolios
+    targets : list
+        The target volatilities (RISK) or returns (RETURN) to solve for
+    target_type : str
+        RISK: efficient_risk for each target
+        RETURN: efficient_return for each target
+    p_max, min_returns, s_asset, asset_len, risk_model, n_factors, shrinkage, quality_flags : 
+        As in portfolio_generate_test
+    n_jobs : int
+        The number of worker processes to split the targets over,
+        each compiles the problem once
+    cache : ResultCache or Boolean, optional
+        As in portfolio_generate_test
+
+    Returns
+    -------
+    DataFrame 
+        One row per target with the FRONTIER_COLUMNS, the cleaned 'weights'
+        of infeasible targets are None & 'feasible' is False
+    """
+    if target_type not in ['RISK', 'RETURN']:
+        raise ValueError('target_type must be one of RISK, RETURN')
+    if cache is not None and cache is not False:
+        params = {'targets': [float(target) for target in targets], 'target_type': target_type, 'p_max': p_max, 
+                  'min_returns': min_returns, 's_asset': s_asset, 'asset_len': asset_len, 
+                  'risk_model': risk_model, 'n_factors': n_factors, 'shrinkage': shrinkage, 
+                  'quality_flags': quality_flags}
+        return _cached(cache, 'efficient_frontier_sweep', database, startdate, enddate, params,
+                       lambda: efficient_frontier_sweep(database, startdate, enddate, n_jobs=n_jobs, **params))
+    mu, S, top_stocks=screen_and_estimate(database,startdate,enddate,p_max,min_returns,s_asset,asset_len,
+                                          risk_model=risk_model,n_factors=n_factors,shrinkage=shrinkage,
+                                          quality_flags=quality_flags)
+
+    if n_jobs == 1:
+        rows = _solve_frontier_points(mu, S, targets, target_type)
+    else:
+        n_chunks = len(targets) if n_jobs < 1 else min(n_jobs, len(targets))
+        chunks = [chunk.tolist() for chunk in np.array_split(np.asarray(targets), n_chunks)]
+        chunk_rows = traced_parallel(Parallel(n_jobs=n_jobs), 
+                                     (delayed(_solve_frontier_points)(mu, S, chunk, target_type) for chunk in chunks))
+        rows = [row for chunk in chunk_rows for row in chunk]
+    return pd.DataFrame(rows, columns=FRONTIER_COLUMNS)
+
+#Backtesting functions
+
+#column names of the result rows returned by portfolio_generate_test
+RESULT_COLUMNS = ['startdate', 'enddate', 'expected_returns', 'volatility', 'sharpe',
+                  'max_returns', 'min_returns', 'actual_returns', 'mean_returns', 'objective']
+
+def walk_forward_schedule(startdate, enddate, window_years=2, step_months=1, expanding=False):
+    """Generates the (startdate, enddate) windows of a walk-forward backtest.
+    Parameters
+    ----------
+    startdate : str
+        'YYYY-MM-DD' start of the first window
+    enddate : str
+        'YYYY-MM-DD' latest end date of any window, leave a year after 
+        this in the database for the next year evaluation
+    window_years : int
+        The length in years of each estimation window
+    step_months : int
+        The number of months each window moves forward by
+    expanding : Boolean
+        False: rolling windows of window_years
+        True:  windows all start at startdate & grow by step_months
+
+    Returns
+    -------
+    list 
+        list of ('YYYY-MM-DD', 'YYYY-MM-DD') window tuples
+    """
+    first_start = pd.to_datetime(startdate)
+    last_end = pd.to_datetime(enddate)
+    windows = []
+    step = 0
+    while True:
+        window_end = first_start + pd.DateOffset(years=window_years, months=step*step_months)
+        if window_end > last_end:
+            break
+        if expanding == True:
+            window_start = first_start
+        else:
+            window_start = first_start + pd.DateOffset(months=step*step_months)
+        windows.append((prettyPrintDate(window_start), prettyPrintDate(window_end)))
+        step += 1
+    return windows
+
+def _walk_forward_task(database, startdate, enddate, config, cache=None):
+    """Runs portfolio_generate_test for one window & config, 
+    returning the error as a row rather than raising"""
+    try:
+        row = portfolio_generate_test(database, startdate, enddate, silent=True, cache=cache, **config)
+        return row + [None]
+    except Exception as e:
+        objective = config.get('obj_method', 'SHARPE')
+        return ([pd.to_datetime(startdate), pd.to_datetime(enddate)] 
+                + [np.nan]*7 + [objective, repr(e)])
+
+def _walk_forward_windows(database, windows, config, cache=None):
+    """Runs _walk_forward_task for each window, returning a list of rows"""
+    return [_walk_forward_task(database, startdate, enddate, config, cache) for startdate, enddate in windows]
+
+def _rank_tickers(scores):
+    """Orders tickers by score from best to worst with NaN scores last, 
+    ties keep their order as in top_n_tickers"""
+    values = scores.to_numpy()
+    valid = np.flatnonzero(~np.isnan(values))
+    order = valid[np.argsort(-values[valid], kind='stable')]
+    return scores.index[np.concatenate([order, np.flatnonzero(np.isnan(values))])]
+
+def _walk_forward_rolling(database, windows, config, cache=None, max_tickers=1000):
+    """Runs portfolio_generate_test for one SAMPLE config over consecutive windows,
+    keeping one RollingMoments of the screened stocks as the windows slide so only
+    the rows entering & leaving each window are added to or removed from the 
+    estimates. Falls back to _walk_forward_task per window if the windows screen
+    more than max_tickers stocks in total"""
+    params = {'p_max': 400, 'min_returns': 0.01, 's_asset': 0, 'asset_len': 50, 'obj_method': 'SHARPE',
+              'target_percent': 0.1, 'optimiser': 'PYPFOPT', 'risk_model': 'SAMPLE', 'n_factors': 10, 
+              'shrinkage': 0.0, 'quality_flags': 0}
+    params.update(config)
+    screened = []
+    for startdate, enddate in windows:
+        try:
+            screened.append(_screen_tickers_indexed(database, startdate, enddate, params['p_max'], 
+                                                    params['min_returns'], True, params['quality_flags']))
+        except Exception as e:
+            screened.append(e)
+    union = pd.Index(sorted(set(ticker for tickers in screened if not isinstance(tickers, Exception) 
+                                for ticker in tickers)))
+    if len(union) > max_tickers:
+        return _walk_forward_windows(database, windows, config, cache)
+    rm = RollingMoments(database, union)
+    e_asset = None if params['asset_len'] is None else params['s_asset'] + params['asset_len']
+
+    def run(startdate, enddate, l_screened):
+        if isinstance(l_screened, Exception):
+            raise l_screened
+        rm.window(startdate, enddate)
+        top_stocks = _rank_tickers(rm.mean_historical_return(tickers=l_screened))[params['s_asset']:e_asset]
+        mu = rm.mean_historical_return(tickers=top_stocks)
+        S = rm.sample_cov(tickers=top_stocks)
+        ef, objective_summary = optimise_portfolio(mu, S, params['obj_method'], params['target_percent'], params['optimiser'])
+        df_actual = next_year_prices(database, enddate, top_stocks)
+        df_perf = evaluate_portfolios(df_actual, pd.DataFrame([ef.clean_weights()])).iloc[0]
+        return ([pd.to_datetime(startdate), pd.to_datetime(enddate)] + list(ef.portfolio_performance())
+                + [df_perf[column] for column in ['max_returns', 'min_returns', 'actual_returns', 'mean_returns']]
+                + [objective_summary])
+
+    rows = []
+    for (startdate, enddate), l_screened in zip(windows, screened):
+        try:
+            if cache is not None and cache is not False:
+                row = _cached(cache, 'portfolio_generate_test', database, startdate, enddate, params,
+                              lambda: run(startdate, enddate, l_screened))
+            else:
+                row = run(startdate, enddate, l_screened)
+            rows.append(row + [None])
+        except Exception as e:
+            rows.append([pd.to_datetime(startdate), pd.to_datetime(enddate)] 
+                        + [np.nan]*7 + [params['obj_method'], repr(e)])
+    return rows
+
+@timed()
+def run_walk_forward(database, schedule, configs=None, n_jobs=-1, cache=None, rolling=True, rolling_max_tickers=1000):
+    """Runs portfolio_generate_test over a schedule of windows & configs across 
+    a process pool. Pass a PriceMatrix (or exchange name) so each worker maps 
+    the same price file rather than being sent a pickled copy of the prices.
+    For a PriceMatrix with an availability index, SAMPLE configs are run on
+    consecutive runs of windows per worker with a RollingMoments estimator, 
+    so sliding a window only processes the rows entering & leaving it.
+    Parameters
+    ----------
+    database : PriceMatrix, str or DataFrame
+        The prices, an exchange name opens its PriceMatrix
+    schedule : list
+        list of (startdate, enddate) windows, see walk_forward_schedule
+    configs : list, optional
+        list of dicts of portfolio_generate_test keyword arguments
+        e.g. [{'obj_method':'SHARPE'}, {'obj_method':'RISK','target_percent':0.15}]
+        default is a single SHARPE run per window
+    n_jobs : int
+        The number of worker processes, -1 uses all cores
+    cache : ResultCache or Boolean, optional
+        Reuses the stored results of windows & configs already run on 
+        the same prices, failed runs are not cached
+    rolling : Boolean
+        True: uses the RollingMoments estimator where it applies, its mu & S 
+        match pypfopt's to float32 precision
+        False: every window is estimated from scratch
+    rolling_max_tickers : int
+        Windows screening more stocks than this in total are estimated from
+        scratch, as RollingMoments memory grows with the square of the stocks
+
+    Returns
+    -------
+    DataFrame 
+        One row per window & config with the RESULT_COLUMNS of 
+        portfolio_generate_test & an 'error' column for failed solves
+    """
+    if isinstance(database, str):
+        database = open_price_matrix(database)
+    if configs is None:
+        configs = [{}]
+    if cache is True:
+        cache = ResultCache()
+    use_rolling = rolling == True and isinstance(database, PriceMatrix) and database.availability() is not None
+
+    #each task is a run of consecutive windows of a rolling config or a single window of any other
+    tasks, positions = [], []
+    n_chunks = max(1, min(effective_n_jobs(n_jobs), len(schedule)))
+    for j, config in enumerate(configs):
+        if use_rolling and config.get('risk_model', 'SAMPLE') == 'SAMPLE':
+            for chunk in np.array_split(np.arange(len(schedule)), n_chunks):
+                if len(chunk) > 0:
+                    tasks.append(delayed(_walk_forward_rolling)(database, [schedule[i] for i in chunk], config, 
+                                                                cache, rolling_max_tickers))
+                    positions.append([(i, j) for i in chunk])
+        else:
+            for i, (startdate, enddate) in enumerate(schedule):
+                tasks.append(delayed(_walk_forward_windows)(database, [(startdate, enddate)], config, cache))
+                positions.append([(i, j)])
+
+    results = {}
+    for task_positions, task_rows in zip(positions, traced_parallel(Parallel(n_jobs=n_jobs), tasks)):
+        results.update(zip(task_positions, task_rows))
+    #rows are ordered by window then config
+    rows = [results[(i, j)] for i in range(len(schedule)) for j in range(len(configs))]
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS+['error'])
+
+#Hyperparameter grid functions
+
+#parameters of a grid config, the stage of the run each is first needed in & its default
+GRID_PARAMETERS = OrderedDict([('p_max', ('screen', 400)), 
+                               ('min_returns', ('screen', 0.01)),
+                               ('quality_flags', ('screen', 0)),
+                               ('s_asset', ('estimate', 0)), 
+                               ('asset_len', ('estimate', 50)),
+                               ('risk_model', ('estimate', 'SAMPLE')), 
+                               ('n_factors', ('estimate', 10)),
+                               ('shrinkage', ('estimate', 0.0)),
+                               ('obj_method', ('solve', 'SHARPE')), 
+                               ('target_percent', ('solve', 0.1)),
+                               ('optimiser', ('solve', 'PYPFOPT'))])
+
+def grid_configs(grid):
+    """Expands a grid into a list of complete configs.
+    Parameters
+    ----------
+    grid : dict or list
+        dict of lists of values of GRID_PARAMETERS, every combination is a config
+        e.g. {'obj_method':['SHARPE','RISK'], 'asset_len':[20,50]},
+        or a list of config dicts. Missing parameters take their defaults
+
+    Returns
+    -------
+    list 
+        list of dicts with a value for every one of the GRID_PARAMETERS
+    """
+    if isinstance(grid, dict):
+        unknown = set(grid) - set(GRID_PARAMETERS)
+        if len(unknown) > 0:
+            raise ValueError('Unknown grid parameters: '+str(sorted(unknown)))
+        names = list(grid)
+        grid = [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+    defaults = {name: default for name, (_, default) in GRID_PARAMETERS.items()}
+    configs = [dict(defaults, **config) for config in grid]
+    for config in configs:
+        #flag names are held as bits so every config is hashable
+        config['quality_flags'] = _flag_bits(config['quality_flags'])
+    return configs
+
+def _stage_key(config, stages):
+    """Returns the values of the parameters a config needs up to & including stages"""
+    return tuple(config[name] for name, (stage, _) in GRID_PARAMETERS.items() if stage in stages)
+
+def _grid_screen(database, startdate, enddate, p_max, min_returns, quality_flags):
+    """Screens the universe once for a (p_max, min_returns, quality_flags) & ranks every 
+    remaining stock, so each (s_asset, asset_len) is a slice of the same ranking"""
+    if isinstance(database, PriceMatrix) and database.availability() is not None:
+        l_screened = _screen_tickers_indexed(database, startdate, enddate, p_max, min_returns, True, quality_flags)
+        return None, top_n_tickers(database, startdate, enddate, l_screened, 0, None)
+    df_input = screen_universe(database, startdate, enddate, p_max, min_returns, True, quality_flags)
+    return df_input, expected_returns.mean_historical_return(df_input).sort_values(ascending=False).index
+
+def _grid_estimate(database, startdate, enddate, screened, s_asset, asset_len, risk_model, n_factors, shrinkage):
+    """Estimates mu & S of a slice of a screen's ranking as estimate_top_assets"""
+    df_input, ranked = screened
+    top_stocks = ranked[s_asset:None if asset_len is None else s_asset + asset_len]
+    if df_input is None:
+        df = database.window(startdate, enddate, top_stocks)
+    else:
+        df = df_input[top_stocks]
+    return expected_returns.mean_historical_return(df), _estimate_risk(df, risk_model, n_factors, shrinkage), top_stocks
+
+@timed()
+def run_grid(database, startdate, enddate, grid, n_jobs=-1, cache=None):
+    """Runs portfolio_generate_test for every config of a hyperparameter grid on
+    one window, computing each distinct stage once: the screen per (p_max, 
+    min_returns, quality_flags), mu & S per (s_asset, asset_len, risk_model, n_factors, shrinkage) 
+    of a screen & the following year's prices per estimate. Only the solves are 
+    fanned out to the worker processes, one task per estimate.
+    Parameters
+    ----------
+    database : PriceMatrix, str or DataFrame
+        The prices, an exchange name opens its PriceMatrix
+    startdate, enddate : str
+        'YYYY-MM-DD' bounds of the window used to build the portfolios
+    grid : dict or list
+        The configs to run, see grid_configs
+    n_jobs : int
+        The number of worker processes, -1 uses all cores
+    cache : ResultCache or Boolean, optional
+        Reuses the stored results of configs already run on the same prices,
+        shared with portfolio_generate_test. Only the stages of the other 
+        configs are run & failed configs are not cached
+
+    Returns
+    -------
+    DataFrame 
+        One row per config with its GRID_PARAMETERS prefixed 'config_', the 
+        RESULT_COLUMNS of portfolio_generate_test & an 'error' column for failed configs
+    """
+    if isinstance(database, str):
+        database = open_price_matrix(database)
+    configs = grid_configs(grid)
+
+    #a config's GRID_PARAMETERS are the parameters portfolio_generate_test caches its result under
+    if cache is True:
+        cache = ResultCache()
+    cache_keys, cached = {}, {}
+    if cache is not None and cache is not False:
+        for i, config in enumerate(configs):
+            cache_keys[i] = cache.key('portfolio_generate_test', database, startdate, enddate, config)
+            result = cache.get(cache_keys[i])
+            if result is not None:
+                cached[i] = result
+        current_span().set(cache_hits=len(cached))
+
+    #build the DAG, each config is a leaf of an estimate which depends on a screen
+    screens, estimates, leaves = OrderedDict(), OrderedDict(), OrderedDict()
+    for i, config in enumerate(configs):
+        if i in cached:
+            continue
+        screen_key = _stage_key(config, ['screen'])
+        estimate_key = _stage_key(config, ['screen', 'estimate'])
+        #the target is only used by the RISK & RETURN objectives
+        target_percent = config['target_percent'] if config['obj_method'] in ['RISK', 'RETURN'] else None
+        screens.setdefault(screen_key, None)
+        estimates.setdefault(estimate_key, screen_key)
+        leaves.setdefault(estimate_key, OrderedDict()).setdefault((config['obj_method'], target_percent, config['optimiser']))
+
+    for screen_key in screens:
+        try:
+            screens[screen_key] = _grid_screen(database, startdate, enddate, *screen_key)
+        except Exception as e:
+            screens[screen_key] = e
+
+    inputs = OrderedDict()
+    for estimate_key, screen_key in estimates.items():
+        screened = screens[screen_key]
+        if isinstance(screened, Exception):
+            inputs[estimate_key] = screened
+            continue
+        try:
+            inputs[estimate_key] = _grid_estimate(database, startdate, enddate, screened, *estimate_key[len(screen_key):])
+        except Exception as e:
+            inputs[estimate_key] = e
+
+    solvable = [key for key in inputs if not isinstance(inputs[key], Exception)]
+    solved = traced_parallel(Parallel(n_jobs=n_jobs), 
+                             (delayed(_grid_solve)(inputs[key][0], inputs[key][1], list(leaves[key])) for key in solvable))
+
+    #evaluate all the portfolios of an estimate over one block of the following year's prices
+    results = {}
+    for key, rows in zip(solvable, solved):
+        solved_rows = [row for row in rows if row[5] is None]
+        if len(solved_rows) > 0:
+            df_actual = next_year_prices(database, enddate, inputs[key][2])
+            df_perf = evaluate_portfolios(df_actual, pd.DataFrame([row[3] for row in solved_rows]))
+            perf = iter(df_perf[['max_returns', 'min_returns', 'actual_returns', 'mean_returns']].to_numpy().tolist())
+        for leaf, row in zip(leaves[key], rows):
+            stats = next(perf) if row[5] is None else [np.nan]*4
+            results[(key, leaf)] = row[:3] + stats + [row[4], row[5]]
+
+    table = []
+    for i, config in enumerate(configs):
+        estimate_key = _stage_key(config, ['screen', 'estimate'])
+        target_percent = config['target_percent'] if config['obj_method'] in ['RISK', 'RETURN'] else None
+        leaf = (config['obj_method'], target_percent, config['optimiser'])
+        if i in cached:
+            row = list(cached[i][2:]) + [None]
+        elif isinstance(inputs[estimate_key], Exception):
+            row = [np.nan]*7 + [config['obj_method'], repr(inputs[estimate_key])]
+        else:
+            row = results[(estimate_key, leaf)]
+            if i in cache_keys and row[-1] is None:
+                cache.put(cache_keys[i], [pd.to_datetime(startdate), pd.to_datetime(enddate)] + row[:-1])
+        table.append([config[name] for name in GRID_PARAMETERS] 
+                     + [pd.to_datetime(startdate), pd.to_datetime(enddate)] + row)
+    #the config columns are prefixed as min_returns is both a parameter & a result
+    return pd.DataFrame(table, columns=['config_'+name for name in GRID_PARAMETERS]+RESULT_COLUMNS+['error'])
@@ -0,0 +1,129 @@
+#Disk-backed cache of the results of the batch runners
+import os
+import json
+import zlib
+import hashlib
+import pickle
+
+import pandas as pd
+
+from .instrument import span
+from .store import PRICE_DB_DIR, prettyPrintDate
+from .matrix import PriceMatrix
+
+#Result cache functions
+
+#Results are kept on disk keyed by a hash of the parameters & a fingerprint of the
+#prices they read, so reruns after a restart are lookups & an update_db which 
+#changes a window's prices changes its key rather than needing entries deleted.
+RESULT_CACHE_DIR = os.path.join(PRICE_DB_DIR, 'result_cache')
+
+def _window_fingerprint(database, startdate, enddate):
+    """Returns a string which changes whenever the prices read by a run on
+    startdate to enddate (& the following year) change, or the latest prices
+    the p_max screen is applied to change. Any update of a PriceMatrix's prices
+    changes the latest prices, so a PriceMatrix is fingerprinted as a whole"""
+    if isinstance(database, PriceMatrix):
+        #partitions are never rewritten in place, so those the matrix was opened on identify its prices,
+        #not the store's current ones which a matrix opened before an update_db doesn't read
+        last_date = prettyPrintDate(database.dates[-1]) if len(database) > 0 else None
+        return 'matrix:'+str(database.exchange)+':'+json.dumps([database.version, database.partitions, last_date])
+    first_date = pd.to_datetime(startdate)
+    last_date = pd.to_datetime(enddate) + pd.DateOffset(days=2, years=1)
+    latest = database.iloc[-1:]
+    database = database[first_date:last_date]
+    digest = hashlib.sha1(pd.util.hash_pandas_object(database, index=True).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(latest, index=True).to_numpy().tobytes())
+    digest.update(json.dumps([str(col) for col in database.columns]).encode())
+    return 'frame:'+digest.hexdigest()
+
+class ResultCache:
+    """Size bounded, least recently used cache of results on disk, 
+    one zlib compressed pickle per entry. Safe to share between the 
+    worker processes of run_walk_forward.
+    Parameters
+    ----------
+    path : str
+        The folder holding the cache, default 'Price Databases/result_cache'
+    max_bytes : int
+        The least recently used entries are evicted once the 
+        compressed entries take more than this
+    """
+    def __init__(self, path=RESULT_CACHE_DIR, max_bytes=256*1024**2):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, fn_name, database, startdate, enddate, params):
+        """Returns the cache key of a run of fn_name on a window with params"""
+        key = {'fn': fn_name,
+               'data': _window_fingerprint(database, startdate, enddate),
+               'startdate': prettyPrintDate(pd.to_datetime(startdate)),
+               'enddate': prettyPrintDate(pd.to_datetime(enddate)),
+               'params': params}
+        return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key+'.pkl.z')
+
+    def get(self, key):
+        """Returns the cached result of key, None if it is not cached"""
+        filename = self._entry_path(key)
+        try:
+            with open(filename, 'rb') as f:
+                result = pickle.loads(zlib.decompress(f.read()))
+            #the modified time of an entry is its last use
+            os.utime(filename)
+        except (FileNotFoundError, zlib.error, pickle.UnpicklingError, EOFError):
+            return None
+        return result
+
+    def put(self, key, result):
+        """Stores result under key, then evicts the least recently used entries"""
+        filename = self._entry_path(key)
+        tmp_filename = filename+'.'+str(os.getpid())+'.tmp'
+        with open(tmp_filename, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp_filename, filename)
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl.z'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Removes every entry of the cache"""
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl.z'):
+                os.remove(entry.path)
+
+def _cached(cache, fn_name, database, startdate, enddate, params, compute):
+    """Returns the cached result of a run, computing & storing it on a miss"""
+    if cache is None:
+        return compute()
+    if cache is True:
+        cache = ResultCache()
+    with span('result_cache', fn=fn_name) as sp:
+        key = cache.key(fn_name, database, startdate, enddate, params)
+        result = cache.get(key)
+        sp.set(hit=result is not None)
+    if result is None:
+        result = compute()
+        cache.put(key, result)
+    return result
@@ -0,0 +1,92 @@
+#Client of the local portfolio service, kept free of the optimisers so notebooks using it start quickly
+import json
+import socket
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+
+class ServiceClient:
+    """Blocking client of a PortfolioService, see DatabaseMainFnc.service.
+    Parameters
+    ----------
+    host, port : str, int
+        The address the service listens on
+    path : str, optional
+        The Unix socket the service listens on instead of host:port
+    timeout : float, optional
+        Seconds to wait for a response, None waits indefinitely
+    """
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT, path=None, timeout=None):
+        if path is None:
+            self._sock = socket.create_connection((host, port), timeout=timeout)
+        else:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(path)
+        self._file = self._sock.makefile('rb')
+        self._next_id = 0
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def request_many(self, method, params_list):
+        """Sends one request per params dict without waiting, so the service
+        works on them together & merges any sharing a window, then returns
+        the results in the same order. Failed requests raise a RuntimeError"""
+        ids = []
+        for params in params_list:
+            self._next_id += 1
+            ids.append(self._next_id)
+            self._sock.sendall(json.dumps({'id': self._next_id, 'method': method, 'params': params}).encode()+b'\n')
+        responses = {}
+        while len(responses) < len(ids):
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError('Portfolio service closed the connection')
+            response = json.loads(line)
+            responses[response['id']] = response
+        for request_id in ids:
+            if 'error' in responses[request_id]:
+                raise RuntimeError('Portfolio service '+method+' failed: '+responses[request_id]['error'])
+        return [responses[request_id]['result'] for request_id in ids]
+
+    def request(self, method, **params):
+        """Sends one request & returns its result"""
+        return self.request_many(method, [params])[0]
+
+    def optimise(self, startdate, enddate, **params):
+        """Returns the expected_returns, volatility, sharpe, weights & objective
+        of a window's portfolio, params are any GRID_PARAMETERS"""
+        return self.request('optimise', startdate=startdate, enddate=enddate, **params)
+
+    def efficient_frontier_sweep(self, startdate, enddate, targets, target_type='RISK', **params):
+        """As efficient_frontier_sweep, solved by the service"""
+        import pandas as pd
+        rows = self.request('frontier', startdate=startdate, enddate=enddate, targets=list(targets),
+                            target_type=target_type, **params)
+        return pd.DataFrame(rows)
+
+    def portfolio_generate_test(self, startdate, enddate, **params):
+        """As portfolio_generate_test (silent), run by the service"""
+        import pandas as pd
+        result = self.request('backtest', startdate=startdate, enddate=enddate, **params)
+        result['startdate'], result['enddate'] = pd.to_datetime(result['startdate']), pd.to_datetime(result['enddate'])
+        return list(result.values())
+
+    def backtest_windows(self, windows, **params):
+        """Runs portfolio_generate_test on each (startdate, enddate) of windows in
+        one batch, e.g. from walk_forward_schedule. Returns a DataFrame with
+        the RESULT_COLUMNS"""
+        import pandas as pd
+        results = self.request_many('backtest', [dict(params, startdate=str(startdate), enddate=str(enddate))
+                                                 for startdate, enddate in windows])
+        df = pd.DataFrame(results)
+        df['startdate'], df['enddate'] = pd.to_datetime(df['startdate']), pd.to_datetime(df['enddate'])
+        return df
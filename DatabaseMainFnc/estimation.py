@@ -0,0 +1,252 @@
+#Estimators of expected returns & covariance
+import numpy as np
+import pandas as pd
+
+from .matrix import PriceMatrix
+
+#Estimation functions
+
+class RollingMoments:
+    """Running sums & pairwise cross-products of the daily returns of a sliding 
+    window of prices, so moving the window by k rows costs O(k*n^2) for n assets 
+    rather than re-estimating from the whole window. Missing prices are handled
+    with pairwise counts, as pandas does in DataFrame.cov.
+    Returns are taken between consecutive rows of the window with no filling, 
+    matching pypfopt's returns_from_prices with pct_change(fill_method=None).
+    Parameters
+    ----------
+    prices : DataFrame or PriceMatrix
+        The prices with a row per date & a column per ticker
+    tickers : list, optional
+        The tickers to estimate for, all tickers if None. Memory grows with 
+        the square of the number of tickers so pass the screened universe
+    frequency : int
+        The number of trading days in a year, default is 252
+    log_returns : Boolean
+        True: uses log returns as in pypfopt's log_returns option
+    """
+    def __init__(self, prices, tickers=None, frequency=252, log_returns=False):
+        if isinstance(prices, PriceMatrix):
+            if tickers is None:
+                tickers = prices.tickers
+            self.values = prices.values[:, prices._columns(tickers)]
+            self.dates = prices.dates
+        else:
+            if tickers is None:
+                tickers = prices.columns
+            self.values = prices[tickers].to_numpy(dtype='float64')
+            self.dates = pd.DatetimeIndex(prices.index)
+        self.tickers = pd.Index(tickers)
+        self.frequency = frequency
+        self.log_returns = log_returns
+        self.reset()
+
+    def reset(self):
+        """Empties the window & zeroes the running sums"""
+        n = len(self.tickers)
+        self.rows = (0, 0)
+        self.n_obs = np.zeros((n, n))   #pairwise count of rows where both returns are valid
+        self.s_x = np.zeros((n, n))     #s_x[i,j] sum of returns of i over rows where j is valid
+        self.s_xy = np.zeros((n, n))    #pairwise sum of cross-products of returns
+        self.s_log = np.zeros(n)        #sum of log(1+returns) for the compounded mean
+
+    def _returns(self, start, end):
+        """Returns the (end-start) x n block of returns of rows start to end-1"""
+        prices = np.asarray(self.values[max(start-1, 0):end])
+        #taken in the prices' dtype as pct_change does, then summed in float64
+        returns = (prices[1:] / prices[:-1] - 1).astype('float64')
+        if start == 0:
+            #the first row has no previous price
+            returns = np.vstack([np.full((1, prices.shape[1]), np.nan), returns])
+        if self.log_returns == True:
+            returns = np.log(1 + returns)
+        return returns
+
+    def _update(self, returns, sign):
+        """Adds (sign=1) or removes (sign=-1) a block of returns from the running sums"""
+        if len(returns) == 0:
+            return
+        mask = (~np.isnan(returns)).astype('float64')
+        x = np.nan_to_num(returns)
+        self.n_obs += sign * (mask.T @ mask)
+        self.s_x += sign * (x.T @ mask)
+        self.s_xy += sign * (x.T @ x)
+        self.s_log += sign * np.log1p(x).sum(axis=0)
+
+    def window(self, startdate, enddate):
+        """Moves the estimation window to the prices between startdate & enddate 
+        inclusive, only the rows entering & leaving the window are processed.
+        Parameters
+        ----------
+        startdate, enddate : str
+            'YYYY-MM-DD' bounds of the window
+
+        Returns
+        -------
+        RollingMoments 
+            self, so estimates can be chained e.g. rm.window(s, e).sample_cov()
+        """
+        start = self.dates.searchsorted(pd.to_datetime(startdate), side='left')
+        end = self.dates.searchsorted(pd.to_datetime(enddate), side='right')
+        #the returns of a window are those of its rows after the first one
+        old_start, old_end = self.rows
+        new_start, new_end = min(start+1, end), end
+
+        if new_start >= old_end or new_end <= old_start or old_start == old_end:
+            self.reset()
+            self._update(self._returns(new_start, new_end), 1)
+        else:
+            if new_start > old_start:
+                self._update(self._returns(old_start, new_start), -1)
+            elif new_start < old_start:
+                self._update(self._returns(new_start, old_start), 1)
+            if new_end > old_end:
+                self._update(self._returns(old_end, new_end), 1)
+            elif new_end < old_end:
+                self._update(self._returns(new_end, old_end), -1)
+        self.rows = (new_start, new_end)
+        return self
+
+    def _subset(self, tickers):
+        """Returns the tickers & their positions in the estimator, all if tickers is None"""
+        if tickers is None:
+            return self.tickers, np.arange(len(self.tickers))
+        tickers = pd.Index(tickers)
+        idx = self.tickers.get_indexer(tickers)
+        if (idx < 0).any():
+            raise KeyError('Tickers not in the estimator: '+str(list(tickers[idx < 0])))
+        return tickers, idx
+
+    def mean_historical_return(self, compounding=True, tickers=None):
+        """Annualised mean daily return of each ticker over the window, 
+        matches expected_returns.mean_historical_return.
+        Parameters
+        ----------
+        compounding : Boolean
+            True: geometric mean (CAGR), False: arithmetic mean
+        tickers : list, optional
+            The tickers to return, all tickers if None
+
+        Returns
+        -------
+        Series 
+            annualised mean return indexed by ticker
+        """
+        tickers, idx = self._subset(tickers)
+        count = np.diag(self.n_obs)[idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if compounding == True:
+                mu = np.exp(self.s_log[idx] * (self.frequency / count)) - 1
+            else:
+                mu = np.diag(self.s_x)[idx] / count * self.frequency
+        return pd.Series(mu, index=tickers)
+
+    def sample_cov(self, fix_method='spectral', tickers=None):
+        """Annualised sample covariance of the daily returns over the window,
+        matches risk_models.sample_cov.
+        Parameters
+        ----------
+        fix_method : str
+            How risk_models fixes a matrix which is not positive semidefinite,
+            'spectral' or 'diag'
+        tickers : list, optional
+            The tickers to return, all tickers if None. The fix is applied 
+            to their covariance only, as sample_cov of their prices would
+
+        Returns
+        -------
+        DataFrame 
+            annualised covariance matrix indexed by ticker on both axes
+        """
+        tickers, idx = self._subset(tickers)
+        n_obs, s_x = self.n_obs[np.ix_(idx, idx)], self.s_x[np.ix_(idx, idx)]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (self.s_xy[np.ix_(idx, idx)] - s_x * s_x.T / n_obs) / (n_obs - 1)
+        cov[n_obs < 2] = np.nan
+        cov = pd.DataFrame(cov * self.frequency, index=tickers, columns=tickers)
+        from pypfopt import risk_models
+        return risk_models.fix_nonpositive_semidefinite(cov, fix_method)
+
+class FactorRiskModel:
+    """Statistical factor model of the annual covariance of returns, 
+    S = F F' + D with n x k loadings F & diagonal idiosyncratic variances D,
+    so it can be held & optimised over in O(n*k) rather than O(n^2).
+    Parameters
+    ----------
+    loadings : DataFrame
+        n x k annualised factor loadings indexed by ticker
+    idiosyncratic : Series
+        Annualised idiosyncratic variance of each ticker
+    """
+    def __init__(self, loadings, idiosyncratic):
+        self.loadings = loadings
+        self.idiosyncratic = idiosyncratic
+
+    def __len__(self):
+        return len(self.idiosyncratic)
+
+    @property
+    def n_factors(self):
+        return self.loadings.shape[1]
+
+    def covariance(self):
+        """Returns the dense n x n covariance matrix, e.g. for EfficientFrontier"""
+        F = self.loadings.to_numpy()
+        return pd.DataFrame(F @ F.T + np.diag(self.idiosyncratic.to_numpy()),
+                            index=self.loadings.index, columns=self.loadings.index)
+
+    def variance(self, weights):
+        """Returns the variance of a portfolio without forming the covariance"""
+        weights = np.asarray(weights, dtype='float64')
+        return np.sum((self.loadings.to_numpy().T @ weights)**2) + np.sum(self.idiosyncratic.to_numpy() * weights**2)
+
+    def global_min_volatility(self):
+        """Returns the volatility of the unconstrained minimum variance portfolio, 
+        using the Woodbury identity for 1' S^-1 1"""
+        F = self.loadings.to_numpy()
+        d_inv = 1 / self.idiosyncratic.to_numpy()
+        b = F.T @ d_inv
+        inner = np.eye(F.shape[1]) + (F.T * d_inv) @ F
+        return np.sqrt(1 / (d_inv.sum() - b @ np.linalg.solve(inner, b)))
+
+def factor_risk_model(prices, n_factors=10, shrinkage=0.0, frequency=252):
+    """Estimates a statistical (PCA) factor model of the annual covariance of 
+    the daily returns of prices, see FactorRiskModel.
+    Parameters
+    ----------
+    prices : DataFrame
+        Prices with a row per date & a column per ticker
+    n_factors : int
+        The number of principal components kept as factors
+    shrinkage : float
+        Between 0 & 1, shrinks each idiosyncratic variance towards 
+        their average, 0 is no shrinkage
+    frequency : int
+        The number of trading days in a year, default is 252
+
+    Returns
+    -------
+    FactorRiskModel 
+        The estimated factor model
+    """
+    from pypfopt import expected_returns
+    returns = expected_returns.returns_from_prices(prices)
+    x = returns.to_numpy(dtype='float64')
+    valid = ~np.isnan(x)
+    #missing returns are taken as the ticker's mean return so they add nothing to the covariance
+    x = np.where(valid, x - np.nanmean(x, axis=0), 0.0)
+    n_obs = np.maximum(valid.sum(axis=0) - 1, 1)
+
+    _, sv, vt = np.linalg.svd(x, full_matrices=False)
+    k = min(n_factors, len(sv))
+    loadings = vt[:k].T * sv[:k] * np.sqrt(frequency / max(len(x) - 1, 1))
+
+    total_variance = (x**2).sum(axis=0) / n_obs * frequency
+    idiosyncratic = total_variance - (loadings**2).sum(axis=1)
+    #keep D positive definite, PCA can explain nearly all the variance of some tickers
+    idiosyncratic = np.clip(idiosyncratic, 1e-6 * np.mean(total_variance), None)
+    if shrinkage > 0:
+        idiosyncratic = (1 - shrinkage) * idiosyncratic + shrinkage * idiosyncratic.mean()
+
+    return FactorRiskModel(pd.DataFrame(loadings, index=returns.columns),
+                           pd.Series(idiosyncratic, index=returns.columns))
@@ -0,0 +1,107 @@
+#Evaluating portfolios over the year following a window
+import numpy as np
+import pandas as pd
+
+from .instrument import timed
+from .matrix import PriceMatrix
+
+#Evaluation functions
+
+#Prices of the year following a window, normalised to their first day
+@timed()
+def next_year_prices(database, enddate, tickers=None):
+    """Selects the prices of the year starting 2 days after enddate & 
+    normalises each stock to its price on the first day. Missing days are 
+    filled with the next valid price & stocks with no later price (delisted)
+    are filled with 0.
+    Parameters
+    ----------
+    database : DataFrame or PriceMatrix
+        The dataframe of stock prices.
+    enddate : str
+        'YYYY-MM-DD' end of the window the portfolios were built on
+    tickers : list, optional
+        The tickers to select, all tickers if None
+
+    Returns
+    -------
+    DataFrame 
+        The normalised prices, 1 on the first day for each stock
+    """
+    actual_startdate = pd.to_datetime(enddate) + pd.DateOffset(days=2)
+    actual_enddate = pd.to_datetime(actual_startdate) + pd.DateOffset(years=1)
+
+    if isinstance(database, PriceMatrix):
+        df_actual=database.window(actual_startdate,actual_enddate,tickers)
+    else:
+        df_actual=database[actual_startdate:actual_enddate]
+        if tickers is not None:
+            df_actual=df_actual[tickers]
+
+    values=df_actual.bfill().fillna(0).to_numpy(dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values=values/values[0]
+    return pd.DataFrame(values, index=df_actual.index, columns=df_actual.columns)
+
+def _weights_matrix(block, weights):
+    """Aligns weights (a dict, Series, DataFrame or array of portfolios) to the 
+    columns of a price block as a (portfolios x tickers) array & its row labels"""
+    if isinstance(weights, (dict, pd.Series)):
+        weights = pd.DataFrame([weights])
+    if isinstance(weights, pd.DataFrame):
+        return weights.reindex(columns=block.columns).fillna(0).to_numpy(dtype='float64'), weights.index
+    weights = np.atleast_2d(np.asarray(weights, dtype='float64'))
+    return weights, pd.RangeIndex(len(weights))
+
+def weighted_values(block, weights):
+    """Values by day of many portfolios over a block of normalised prices
+    Parameters
+    ----------
+    block : DataFrame
+        Normalised prices, see next_year_prices
+    weights : DataFrame, array, dict or Series
+        One row of weights per portfolio, DataFrame columns are matched to 
+        the block's tickers, array columns must be in the block's order
+
+    Returns
+    -------
+    DataFrame 
+        The value of each portfolio (column) by day, starting at 1
+    """
+    w, labels = _weights_matrix(block, weights)
+    #NaNs are stocks with no prices in the year, they are left out of the sum as pandas does
+    values = np.nan_to_num(block.to_numpy(dtype='float64'), nan=0.0) @ w.T
+    return pd.DataFrame(values, index=block.index, columns=labels)
+
+@timed()
+def evaluate_portfolios(block, weights, frequency=252):
+    """Evaluates many portfolios over the same block of normalised prices 
+    in one pass.
+    Parameters
+    ----------
+    block : DataFrame
+        Normalised prices, see next_year_prices
+    weights : DataFrame, array, dict or Series
+        One row of weights per portfolio, see weighted_values
+    frequency : int
+        The number of trading days in a year, used for the volatility
+
+    Returns
+    -------
+    DataFrame 
+        One row per portfolio with the max_returns, min_returns, mean_returns
+        & final actual_returns over the block, its max_drawdown & its 
+        annualised realised volatility
+    """
+    values = weighted_values(block, weights)
+    v = values.to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = 1 - v / np.maximum.accumulate(v, axis=0)
+        daily_returns = v[1:] / v[:-1] - 1
+    return pd.DataFrame({'max_returns': v.max(axis=0) - 1,
+                         'min_returns': v.min(axis=0) - 1,
+                         'mean_returns': v.mean(axis=0) - 1,
+                         'actual_returns': v[-1] - 1,
+                         'max_drawdown': np.nanmax(drawdown, axis=0),
+                         'volatility': daily_returns.std(axis=0, ddof=1) * np.sqrt(frequency)},
+                        index=values.columns)
@@ -0,0 +1,400 @@
+#Fetching prices from a provider into the price store
+import os
+import json
+import time
+import shutil
+import datetime
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta 
+
+import numpy as np
+import pandas as pd
+
+from .instrument import current_span, child_spans, timed, _frame_shape
+from .store import (DATE_FORMAT, PRICE_DB_DIR, connectAndLoadDb, getLastEntryDate, writeDbToExcelFile, 
+                    prettyPrintDate, _store_path, read_store_manifest, append_to_store, load_store, 
+                    migrate_csv_to_store)
+from .matrix import _read_matrix_meta, build_price_matrix, build_availability_index
+from .quality import build_quality_index
+
+#Data Fetching functions
+
+#get ticker list from our tsv files
+def getTickers(exchange):
+    """Pulls in the list of stock tickers for an exchange
+    stored at 'Company lists/companylist_'+str(exchange)+'.tsv'
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Company lists/companylist_'+str(exchange)+'.tsv'
+
+    Returns
+    -------
+    l_tickers : list 
+        list of stock tickers listed on the exchange
+    """
+    #We have the lists saved as TSV ie delimited with tabs rather than commas
+    df_info=pd.read_csv('Company lists/companylist_'+str(exchange)+'.tsv',sep='\t') 
+    l_tickers=df_info.Symbol.tolist()
+    return l_tickers
+
+#Price providers, fetch_prices only needs a download(tickers, start_date) method 
+#so the pipeline can be run offline against SyntheticProvider
+class YahooProvider:
+    """Pulls adj closing prices from yfinance"""
+    def download(self, tickers, start_date):
+        """Returns the adj closing prices of tickers from start_date, 
+        a DataFrame indexed by date with a column per ticker"""
+        import yfinance as yf
+        prices = yf.download(tickers, start_date, progress=False)['Adj Close']
+        if isinstance(prices, pd.Series):
+            prices = prices.to_frame(tickers[0])
+        return prices
+
+class SyntheticProvider:
+    """Serves deterministic synthetic adj closing prices, for running 
+    the fetch pipeline & benchmarks offline. 
+    Parameters
+    ----------
+    missing : list, optional
+        Tickers with no data, as delisted symbols are served by yfinance
+    fail_rate : float
+        The chance each download raises a ConnectionError, to test retries
+    seed : int
+        Seed of the prices & failures
+    """
+    def __init__(self, missing=None, fail_rate=0.0, seed=0):
+        self.missing = set() if missing is None else set(missing)
+        self.fail_rate = fail_rate
+        self.seed = seed
+        self._failures = np.random.default_rng(seed)
+
+    def download(self, tickers, start_date):
+        """Returns the synthetic prices of tickers for the business days 
+        from start_date up to today"""
+        if self._failures.random() < self.fail_rate:
+            raise ConnectionError('Synthetic download failure')
+        #each ticker's price path starts at 2000-01-03 so a date has the same price whatever the start_date
+        dates = pd.bdate_range('2000-01-03', datetime.datetime.today(), name='Date')
+        first = dates.searchsorted(pd.to_datetime(start_date))
+        prices = {}
+        for ticker in tickers:
+            if ticker in self.missing:
+                prices[ticker] = np.full(len(dates) - first, np.nan)
+                continue
+            rng = np.random.default_rng([zlib.crc32(str(ticker).encode()), self.seed])
+            returns = rng.normal(0.0003, 0.02, len(dates))
+            prices[ticker] = (10 + rng.random() * 90) * np.exp(np.cumsum(returns))[first:]
+        return pd.DataFrame(prices, index=dates[first:])
+
+#Fetch pipeline functions
+
+def _fetch_checkpoint_path(exchange):
+    """Returns the folder holding the completed batches of an exchange's current fetch"""
+    return os.path.join(PRICE_DB_DIR, 'fetch_'+str(exchange))
+
+def _failed_ledger_path(exchange):
+    """Returns the path of the failed symbol ledger of an exchange"""
+    return 'Company lists/failedlist_'+str(exchange)+'.tsv'
+
+@timed('fetch_batch')
+def _fetch_batch(provider, tickers, start_date, retries, backoff):
+    """Downloads one batch of tickers, retrying with exponential backoff"""
+    for attempt in range(retries + 1):
+        try:
+            prices = provider.download(tickers, start_date)
+            current_span().set(tickers=len(tickers), attempts=attempt+1, **_frame_shape(prices, 'out'))
+            return prices
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+
+@timed()
+def fetch_prices(exchange, start_date, provider=None, batch_size=200, max_workers=4, retries=3, backoff=1.0):
+    """Fetches adj closing prices for an exchange's tickers in batches on a 
+    bounded thread pool. Completed batches are checkpointed to
+    'Price Databases/fetch_'+str(exchange) so an interrupted fetch for the 
+    same start date resumes where it stopped, symbols with no data or whose 
+    batch failed every retry are appended to the failed symbol ledger at
+    'Company lists/failedlist_'+str(exchange)+'.tsv'. If any batch failed every 
+    retry a RuntimeError is raised once the other batches are checkpointed,
+    so rerunning the fetch only downloads the failed batches.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Company lists/companylist_'+str(exchange)+'.tsv'
+    start_date : str
+        The date 'YYYY-MM-DD' to pull data from
+    provider : object, optional
+        Has a download(tickers, start_date) method, YahooProvider if None
+    batch_size : int
+        The number of tickers per download
+    max_workers : int
+        The number of downloads run at once
+    retries : int
+        The number of retries of a failed download
+    backoff : float
+        Seconds waited before the first retry, doubled on each retry
+
+    Returns
+    -------
+    DataFrame 
+        The prices of the fetched tickers indexed by date
+    """
+    if provider is None:
+        provider = YahooProvider()
+    l_tickers = getTickers(exchange)
+    batches = [l_tickers[i:i+batch_size] for i in range(0, len(l_tickers), batch_size)]
+
+    #only resume a checkpoint of the same fetch
+    checkpoint = _fetch_checkpoint_path(exchange)
+    fetch_info = {'start_date': str(start_date), 'batch_size': batch_size, 'tickers': l_tickers}
+    info_path = os.path.join(checkpoint, 'fetch.json')
+    if os.path.exists(info_path):
+        with open(info_path) as f:
+            if json.load(f) != fetch_info:
+                shutil.rmtree(checkpoint)
+    os.makedirs(checkpoint, exist_ok=True)
+    with open(info_path, 'w') as f:
+        json.dump(fetch_info, f)
+
+    def batch_path(i):
+        return os.path.join(checkpoint, 'batch_'+str(i).zfill(5)+'.parquet')
+
+    todo = [i for i in range(len(batches)) if not os.path.exists(batch_path(i))]
+    print('Fetching '+str(len(todo))+' of '+str(len(batches))+' batches of '+str(exchange)+' tickers')
+
+    #the batches' spans are recorded under this fetch's span though run on the pool's threads
+    parent = current_span()
+
+    def run_batch(i):
+        with child_spans(parent):
+            prices = _fetch_batch(provider, batches[i], start_date, retries, backoff)
+        prices.index = pd.DatetimeIndex(prices.index, name='Date')
+        prices.columns = [str(col) for col in prices.columns]
+        prices.to_parquet(batch_path(i))
+
+    failed = []
+    failed_batches = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {i: pool.submit(run_batch, i) for i in todo}
+        for i, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                failed_batches += 1
+                failed += [[ticker, 'Batch failed: '+repr(e)] for ticker in batches[i]]
+
+    frames = [pd.read_parquet(batch_path(i)) for i in range(len(batches)) if os.path.exists(batch_path(i))]
+    prices = pd.concat(frames, axis=1, sort=True) if len(frames) > 0 else pd.DataFrame(index=pd.DatetimeIndex([], name='Date'))
+    prices = prices.reindex(columns=[t for t in l_tickers if t in prices.columns])
+    failed += [[ticker, 'No data found'] for ticker in prices.columns[prices.isna().all()]]
+    l_failed = set(f[0] for f in failed)
+    failed += [[ticker, 'No data found'] for ticker in l_tickers 
+               if ticker not in prices.columns and ticker not in l_failed]
+
+    df_failed = pd.DataFrame(failed, columns=['Symbol', 'Reason'])
+    df_failed['Start_date'] = str(start_date)
+    df_failed['Fetch_time'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    #the ledger keeps the failures of every fetch, each tagged with its Fetch_time
+    ledger = _failed_ledger_path(exchange)
+    if os.path.exists(ledger):
+        df_failed = pd.concat([pd.read_csv(ledger, sep='\t'), df_failed], ignore_index=True, sort=False)
+    df_failed.to_csv(ledger, sep='\t', index=False)
+    print(str(len(failed))+' failed symbols added to: '+ledger)
+    current_span().set(exchange=str(exchange), batches=len(batches), batches_fetched=len(todo), 
+                       failed_batches=failed_batches, failed_symbols=len(failed), **_frame_shape(prices, 'out'))
+    if failed_batches > 0:
+        #nothing is returned to be saved, so the store isn't updated past days missing these tickers
+        raise RuntimeError(str(failed_batches)+' of '+str(len(batches))+' batches of '+str(exchange)
+                           +' tickers failed every retry, the fetched batches are kept in '+checkpoint
+                           +' & only the failed batches are fetched when rerun')
+    return prices
+
+def clear_fetch_checkpoint(exchange):
+    """Removes the checkpointed batches of an exchange's fetch, 
+    once its prices have been saved to the store"""
+    shutil.rmtree(_fetch_checkpoint_path(exchange), ignore_errors=True)
+
+# Updates data for a given exchange or creates a db from a given ticker list
+@timed()
+def fetchData(database,exchange,start_date, refetchAll = False, provider = None):
+    """adds adj closing price data from a given exchange 
+    from date using Yfinance.
+
+    Parameters
+    ----------
+    database : DataFrame
+        The data base of prices to be appended.
+        Empty DataFrame if starting a new prices database.
+
+    start_date : str
+        When refetchAll=True this denotes the start date 'YYYY-MM-DD' 
+        to pull data from up to yesterday
+        default is '2006-01-01'.
+
+    exchange : str
+        The name of the exchange stored at
+        'Company lists/companylist_'+str(exchange)+'.tsv'
+
+    refetchAll : Boolean
+        False: updates price data from the latest entry up to yesterday
+        True:  refetches all price data from '2006-01-01' to yesterday
+
+    provider : object, optional
+        The price provider passed to fetch_prices, YahooProvider if None
+    Returns
+    -------
+    database : DataFrame 
+        The database of with latest prices added.
+    """ 
+
+    if refetchAll == True:
+        lastEntryDate = datetime.datetime.strptime(start_date, DATE_FORMAT) #Start date here 
+    else:
+        lastEntryDate = getLastEntryDate(database)
+    ydaysDate = datetime.datetime.today() - timedelta(days = 1)
+
+    # checks is the data base already up to date
+    if lastEntryDate >= ydaysDate:
+        print('Data already loaded up to Yesterday')
+        return database
+    else:
+        print("Last entry in Db is of :" + prettyPrintDate(lastEntryDate))
+        print("----------------------------------------------")
+    
+        dateToFetch = lastEntryDate + timedelta(days=1)
+
+        dateStr = prettyPrintDate(dateToFetch)
+        print('Fetching stock closing price of '+str(exchange)+' for days over: ' + dateStr)
+
+        #Pulling adj closing price data in resumable batches, from yfinance by default
+        mergedData = fetch_prices(exchange, dateStr, provider)
+
+        #Making date the index col
+        mergedData['Date']=mergedData.index
+
+        #append our new data onto the existing databae
+        current_span().set(exchange=str(exchange), **_frame_shape(database, 'in'))
+        database = database.append(mergedData, ignore_index=True)
+        current_span().set(**_frame_shape(database, 'out'))
+    
+        print("----------------------------------------------")
+        print("Data fill completed! 👍👍")
+        return database
+
+# one line  function to create or update a db for a given exchange 
+@timed()
+def update_db(exchange, start_date='2006-01-01',refetchAll = False, provider = None):
+    """One line funcion that pulls adj closing price data for 
+    a given exchange into a DataFrame and saves it to the price store at: 
+    'Price Databases\store_'+str(exchange).
+    Daily updates only fetch & write the days since the last entry, 
+    they are appended to the store as a new partition.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Company lists/companylist_'+str(exchange)+'.tsv'
+
+    start_date : str
+        When refetchAll=True this denotes the start date 'YYYY-MM-DD' 
+        to pull data from up to yesterday
+        default is '2006-01-01'.
+
+    refetchAll : Boolean
+        False: updates price data from the latest entry up to yesterday
+        True:  refetches all price data from '2006-01-01' to yesterday
+
+    provider : object, optional
+        The price provider passed to fetch_prices, YahooProvider if None.
+        If a batch of tickers fails every retry nothing is written to the 
+        store & fetch_prices' RuntimeError is raised, rerun to resume
+    Returns
+    -------
+    database : DataFrame 
+        The database of with latest prices added for the exchange.
+    """ 
+    if refetchAll == True:
+        #For a fresh run 
+        database = pd.DataFrame()
+        database = fetchData(database, exchange, start_date, refetchAll, provider)
+        # Drop the last entry prior to saving as it probably is not a full days data
+        database.drop(database.tail(1).index, inplace = True) 
+
+        # Write the data to the store
+        writeDbToExcelFile(database,exchange)
+    else:
+        # Update an existing database, only the last entry date is needed from the store
+        if read_store_manifest(exchange) is None:
+            migrate_csv_to_store(exchange)
+        lastEntry = pd.DataFrame({'Date': [read_store_manifest(exchange)['last_date']]})
+        database = fetchData(lastEntry, exchange, start_date, provider=provider)
+
+        # Drop the last entry prior to saving as it probably is not a full days data
+        database.drop(database.tail(1).index, inplace = True) 
+
+        # Append only the new rows to the store
+        n_rows = append_to_store(database, exchange)
+        print(str(n_rows)+' new rows appended to store: '+_store_path(exchange))
+        current_span().set(exchange=str(exchange), rows_appended=n_rows)
+        # Keep the price matrix & its indexes up to date if they are in use, only the new rows are scanned
+        if _read_matrix_meta(exchange) is not None:
+            build_price_matrix(exchange)
+            build_availability_index(exchange)
+            build_quality_index(exchange)
+
+    # The fetched prices are saved so the checkpointed batches are no longer needed
+    clear_fetch_checkpoint(exchange)
+    return
+
+# for a given echange removes any tickers which have all NULLS in the data base 
+def cleanCompanyList(exchange, use_ledger=False):
+    """After database is created run this to check for any empty 
+    columns and remove the ticket from the company list.
+    After this is ran re run update_db with Refetchall = True.
+    Parameters
+    ----------
+    exchange : str
+        The name of the database stored at
+        'Company lists/companylist_'+str(exchange)+'.tsv'
+    use_ledger : Boolean
+        False: drops the tickers with all NULLS in the database
+        True:  drops the tickers with no data found in the last fetch, read from
+        the failed symbol ledger 'Company lists/failedlist_'+str(exchange)+'.tsv',
+        that also have all NULLS in the database. Only their columns are loaded
+    """ 
+    if use_ledger == True:
+        #create list of symbols with no data, batches which failed are kept to be retried
+        df_failed=pd.read_csv(_failed_ledger_path(exchange),sep='\t')
+        if 'Fetch_time' in df_failed.columns:
+            df_failed=df_failed[df_failed.Fetch_time == df_failed.Fetch_time.max()]
+        l_drop=df_failed.Symbol[df_failed.Reason == 'No data found'].unique().tolist()
+
+        #an update of a few days finds no data for tickers which simply didn't trade, keep any with history
+        if read_store_manifest(exchange) is not None and len(l_drop) > 0:
+            df=load_store(exchange, columns=l_drop)
+            l_drop=df.columns[df.isna().all()].tolist()
+    else:
+        #Load db
+        df=connectAndLoadDb(exchange)
+    
+        #create list of NULL columns
+        l_drop=df.columns[df.isna().all()].tolist()
+
+    #read in company list TSV
+    df_info=pd.read_csv('Company lists/companylist_'+str(exchange)+'.tsv',sep='\t') 
+    df_info.drop(columns=['Unnamed: 0'],inplace=True)
+    df_info.index=df_info.Symbol
+
+    #drop listed rows
+    df_info.drop(index=[t for t in l_drop if t in df_info.index], inplace=True)
+    df_info.reset_index(drop=True, inplace=True)
+
+    df_info.to_csv('Company lists/companylist_'+str(exchange)+'.tsv',sep='\t')
+    print(str(len(l_drop))+' Rows dropped from '+str(exchange))
+    return
@@ -0,0 +1,331 @@
+#FX rates to EUR & converting prices with them
+import os
+import io
+import datetime
+import zlib
+from datetime import timedelta 
+
+import numpy as np
+import pandas as pd
+
+from .instrument import current_span, timed, _frame_shape
+from .store import (PRICE_DB_DIR, prettyPrintDate, _store_path, read_store_manifest, 
+                    write_store, append_to_store, load_store)
+
+#FX rate functions
+
+#FX rates to EUR are kept in the same parquet store as the prices, one column per currency
+FX_STORE = 'curr_rates'
+
+#FX providers, update_fx_store only needs a rates(currency, start_date, end_date) method
+class EcbFxProvider:
+    """Pulls daily EUR reference rates for a whole date range in one request 
+    from the ECB data API, the source forex_python's rates come from"""
+    url = 'https://data-api.ecb.europa.eu/service/data/EXR/D.{}.EUR.SP00.A'
+
+    def rates(self, currency, start_date, end_date):
+        """Returns the rate converting currency to EUR on each published day 
+        between start_date & end_date, a Series indexed by date"""
+        import requests
+        response = requests.get(self.url.format(currency), timeout=60,
+                                params={'startPeriod': start_date, 'endPeriod': end_date, 'format': 'csvdata'})
+        #the ECB answers 404 when there are no rates in the range e.g. over a weekend
+        if response.status_code == 404:
+            return pd.Series(dtype='float64', index=pd.DatetimeIndex([], name='Date'))
+        response.raise_for_status()
+        df = pd.read_csv(io.StringIO(response.text))
+        #the ECB publishes units of currency per EUR
+        return pd.Series(1 / df['OBS_VALUE'].values, index=pd.DatetimeIndex(df['TIME_PERIOD'], name='Date'))
+
+class ForexPythonProvider:
+    """Pulls rates one day at a time with forex_python's get_rate, 
+    parallelised over the days as gen_curr_csv used to"""
+    def rates(self, currency, start_date, end_date):
+        """Returns the rate converting currency to EUR on each calendar day 
+        between start_date & end_date, a Series indexed by date"""
+        from forex_python.converter import get_rate
+        from joblib import Parallel, delayed
+        dates = pd.date_range(start_date, end_date, name='Date')
+        values = Parallel(n_jobs=-1)(delayed(get_rate)(currency,'EUR', date.to_pydatetime()) for date in dates)
+        return pd.Series(values, index=dates, dtype='float64')
+
+class SyntheticFxProvider:
+    """Serves deterministic synthetic business day rates, for running 
+    update_fx_store & benchmarks offline
+    Parameters
+    ----------
+    seed : int
+        Seed of the rates
+    """
+    def __init__(self, seed=0):
+        self.seed = seed
+
+    def rates(self, currency, start_date, end_date):
+        """Returns synthetic rates converting currency to EUR on the 
+        business days between start_date & end_date"""
+        #each currency's path starts at 2000-01-03 so a date has the same rate whatever the range
+        dates = pd.bdate_range('2000-01-03', end_date, name='Date')
+        rng = np.random.default_rng([zlib.crc32(str(currency).encode()), self.seed])
+        rates = (0.005 + rng.random()) * np.exp(np.cumsum(rng.normal(0, 0.005, len(dates))))
+        first = dates.searchsorted(pd.to_datetime(start_date))
+        return pd.Series(rates[first:], index=dates[first:])
+
+@timed('fetch_fx')
+def _fetch_fx(provider, currencies, start_date, end_date, last_rates=None):
+    """Fetches rates of currencies from start_date to end_date & forward fills them 
+    over every calendar day, seeded with last_rates for days before the first rate"""
+    #look back a week so the first days have a rate to fill from when they are holidays
+    lookback = prettyPrintDate(pd.to_datetime(start_date) - pd.DateOffset(days=7))
+    rates_df = pd.concat({curr: provider.rates(curr, lookback, end_date) for curr in currencies}, axis=1)
+    rates_df = rates_df.reindex(pd.date_range(lookback, end_date, name='Date'))
+    if last_rates is not None:
+        rates_df.iloc[0] = rates_df.iloc[0].fillna(last_rates.reindex(currencies))
+    rates_df = rates_df.ffill().loc[start_date:end_date]
+    current_span().set(currencies=list(currencies), **_frame_shape(rates_df, 'out'))
+    return rates_df
+
+@timed()
+def update_fx_store(currencies=['USD','JPY','GBP'], start_date='2006-01-01', provider=None):
+    """Creates or updates the FX store of rates to EUR, only dates & currencies 
+    not already in the store are fetched. Weekends & holidays take the rate 
+    of the last published day.
+    Parameters
+    ----------
+    currencies : list
+        The currencies to keep rates for
+    start_date : str
+        The date 'YYYY-MM-DD' to hold rates from, default is '2006-01-01'
+    provider : object, optional
+        Has a rates(currency, start_date, end_date) method, EcbFxProvider if None
+    """
+    if provider is None:
+        provider = EcbFxProvider()
+    end_date = prettyPrintDate(datetime.datetime.today() - timedelta(1))
+
+    manifest = read_store_manifest(FX_STORE)
+    if manifest is None or manifest['last_date'] is None:
+        print("Fetching exchange data for: "+str(currencies))
+        write_store(_fetch_fx(provider, currencies, start_date, end_date), FX_STORE)
+        return
+
+    #a new currency adds a column to the history so the (small) store is rewritten, without refetching the others
+    rates_df = load_store(FX_STORE)
+    new_currencies = [curr for curr in currencies if curr not in rates_df.columns]
+    if len(new_currencies) > 0:
+        print("Fetching exchange data for: "+str(new_currencies))
+        first_date = prettyPrintDate(rates_df.index[0])
+        rates_df = rates_df.join(_fetch_fx(provider, new_currencies, first_date, manifest['last_date']))
+        write_store(rates_df, FX_STORE)
+
+    last_date = pd.to_datetime(manifest['last_date'])
+    if last_date >= pd.to_datetime(end_date):
+        print('Currency rates already loaded up to Yesterday')
+        return
+    print("Fetching exchange data from : "+prettyPrintDate(last_date + timedelta(1)))
+    all_currencies = rates_df.columns.tolist()
+    new_rows = _fetch_fx(provider, all_currencies, prettyPrintDate(last_date + timedelta(1)), end_date, rates_df.iloc[-1])
+    append_to_store(new_rows, FX_STORE)
+
+def load_fx_rates():
+    """Loads the FX store of rates to EUR, migrating the old 
+    "Price Databases\curr_rates.csv" on first use.
+
+    Returns
+    -------
+    DataFrame 
+        Rates to EUR indexed by calendar day with a column per currency
+    """
+    if read_store_manifest(FX_STORE) is None:
+        filename = os.path.join(PRICE_DB_DIR, 'curr_rates.csv')
+        print('Migrating '+filename+' to store: '+_store_path(FX_STORE))
+        write_store(pd.read_csv(filename, index_col=0), FX_STORE)
+    return load_store(FX_STORE)
+
+@timed()
+def gen_curr_csv(start_date='2006-01-01', provider=None):
+    """
+    Generates or updates the FX rates from each currency to EUR between 
+    start_date & yesterday, and saves to the FX store "Price Databases\store_curr_rates".
+    Rates are requested in bulk date ranges & only the dates missing 
+    from the store are fetched.
+
+    start_date : str
+        The start date 'YYYY-MM-DD' to pull data from up to yesterday
+        default is '2006-01-01'.
+    provider : object, optional
+        The FX provider passed to update_fx_store, EcbFxProvider if None
+    """
+    input_currencies = ['USD','JPY','GBP']
+    print("Fetching Currecy rates from : "+start_date)
+    print("For Eur from : "+str(input_currencies))
+
+    update_fx_store(input_currencies, start_date, provider)
+
+    print("Currecy rates updated")
+    return 
+
+#Currency conversion functions
+
+#native currency of the tickers of each exchange, a 'Currency' column in
+#the company list overrides this for individual tickers
+EXCHANGE_CURRENCIES = {'NASDAQ': 'USD', 'NYSE': 'USD'}
+
+def ticker_currencies(exchange, tickers=None):
+    """Maps the tickers of an exchange to their native currency.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Company lists/companylist_'+str(exchange)+'.tsv'
+    tickers : list, optional
+        The tickers to map, all the exchange's tickers if None
+
+    Returns
+    -------
+    Series 
+        The currency of each ticker indexed by ticker
+    """
+    df_info=pd.read_csv('Company lists/companylist_'+str(exchange)+'.tsv',sep='\t')
+    currencies=pd.Series(EXCHANGE_CURRENCIES.get(exchange, 'EUR'), index=df_info.Symbol.astype(str))
+    if 'Currency' in df_info.columns:
+        currencies=df_info.set_index(df_info.Symbol.astype(str))['Currency'].fillna(currencies)
+    if tickers is not None:
+        currencies=currencies.reindex(tickers).fillna(EXCHANGE_CURRENCIES.get(exchange, 'EUR'))
+    return currencies
+
+class FxConverter:
+    """Converts prices in mixed currencies to EUR, using the rate of each day.
+    The rates aligned to a price date index are cached so repeated windows & 
+    conversions of the same prices don't realign them, & prices are converted 
+    a block of columns at a time so only the result is allocated in full.
+    Parameters
+    ----------
+    rates_df : DataFrame, optional
+        Rates to EUR indexed by day with a column per currency, 
+        the FX store if None
+    """
+    def __init__(self, rates_df=None):
+        self.rates = load_fx_rates() if rates_df is None else rates_df
+        self.version = None
+        self._aligned = None
+
+    def supports(self, currency):
+        """Returns True if prices in currency can be converted"""
+        return currency == 'EUR' or currency in self.rates.columns
+
+    def aligned_rates(self, dates):
+        """Returns the rates of every currency on each of dates as a (dates x currencies)
+        array, days after the last rate use the last rate"""
+        dates = pd.DatetimeIndex(dates)
+        #the last dates aligned are kept whole, as indexes with the same ends can differ in between
+        if self._aligned is None or not dates.equals(self._aligned[0]):
+            rates = self.rates.reindex(dates, method='ffill')
+            rates['EUR'] = 1.0
+            self._aligned = (dates, rates.columns, rates.to_numpy(dtype='float64'))
+        return self._aligned[1:]
+
+    def convert(self, prices, currencies, inplace=False, dtype=None, chunk_size=512):
+        """Converts prices to EUR.
+        Parameters
+        ----------
+        prices : DataFrame
+            Prices indexed by date with a column per ticker
+        currencies : str, dict or Series
+            The currency of all the prices, or of each ticker
+        inplace : Boolean
+            True: overwrites prices with the converted prices
+        dtype : str, optional
+            dtype of the converted prices e.g. 'float32', that of prices if None
+        chunk_size : int
+            The number of columns converted at a time
+
+        Returns
+        -------
+        DataFrame 
+            The prices in EUR
+        """
+        if isinstance(currencies, str):
+            currencies = pd.Series(currencies, index=prices.columns)
+        currencies = pd.Series(currencies).reindex(prices.columns)
+        columns, rates = self.aligned_rates(prices.index)
+        cur_idx = columns.get_indexer(currencies.values)
+        if (cur_idx < 0).any():
+            raise ValueError('Currency not supported: '+str(sorted(set(currencies[cur_idx < 0].astype(str)))))
+
+        values = prices.values
+        #.values is only a view of the frame's data when it holds a single dtype, otherwise copy
+        if inplace == True and np.shares_memory(values, prices.values):
+            out = values
+        else:
+            inplace = False
+            out = np.empty(values.shape, dtype=values.dtype if dtype is None else dtype)
+        for j in range(0, values.shape[1], chunk_size):
+            block = slice(j, j+chunk_size)
+            np.multiply(values[:, block], rates[:, cur_idx[block]], out=out[:, block], casting='unsafe')
+        if inplace == True:
+            return prices
+        return pd.DataFrame(out, index=prices.index, columns=prices.columns, copy=False)
+
+    def window(self, matrix, startdate=None, enddate=None, tickers=None, currencies=None, dtype='float32'):
+        """Converts one window of a PriceMatrix to EUR, only the window is read 
+        & allocated so the matrix itself is never converted in full.
+        Parameters
+        ----------
+        matrix : PriceMatrix
+            The memory-mapped prices
+        startdate, enddate : str, optional
+            'YYYY-MM-DD' bounds of the window, open ended if None
+        tickers : list, optional
+            The tickers to select, all tickers if None
+        currencies : str, dict or Series, optional
+            The currency of the prices or of each ticker, 
+            mapped from the matrix's exchange if None
+        dtype : str
+            dtype of the converted prices
+
+        Returns
+        -------
+        DataFrame 
+            The window's prices in EUR
+        """
+        prices = matrix.window(startdate, enddate, tickers)
+        if currencies is None:
+            currencies = ticker_currencies(matrix.exchange, prices.columns)
+        return self.convert(prices, currencies, dtype=dtype)
+
+#FxConverter of the current FX store version, shared by calls to load_curr_csv
+_FX_CONVERTER = None
+
+def get_fx_converter():
+    """Returns an FxConverter of the FX store, reloaded only when the store has changed"""
+    global _FX_CONVERTER
+    manifest = read_store_manifest(FX_STORE)
+    version = None if manifest is None else manifest['version']
+    if _FX_CONVERTER is None or _FX_CONVERTER.version != version:
+        #the store may have just been migrated from the old csv so read its version again
+        _FX_CONVERTER = FxConverter()
+        _FX_CONVERTER.version = read_store_manifest(FX_STORE)['version']
+    return _FX_CONVERTER
+
+def load_curr_csv(stocks_df,input_curr,inplace=False,dtype=None):
+    """
+    Loads FX rates data, and converts historical stock prices to EUR using the rate at the time.
+    The rates are loaded once per FX store version & aligned to the stock dates once.
+
+    stocks_df : DataFrame
+        Prices indexed by date with a column per ticker
+    input_curr : str, dict or Series
+        The currency of all the prices e.g. 'USD', or of each ticker 
+        e.g. ticker_currencies(exchange)
+    inplace : Boolean
+        True: overwrites stocks_df with the converted prices rather than copying it
+    dtype : str, optional
+        dtype of the converted prices e.g. 'float32', that of stocks_df if None
+    """
+    converter = get_fx_converter()
+
+    l_curr = [input_curr] if isinstance(input_curr, str) else list(pd.Series(input_curr).unique())
+    if not all(converter.supports(curr) for curr in l_curr):
+        return 'Currency not supported'
+
+    return converter.convert(stocks_df, input_curr, inplace=inplace, dtype=dtype)
@@ -0,0 +1,284 @@
+#Instrumentation of the stages of the package: spans, the timed decorator & metrics sinks
+import os
+import time
+import json
+import logging
+import threading
+import functools
+
+#Instrumentation functions
+
+#Stages are wrapped in spans which record their wall time & the attributes set on them
+#(rows & columns in & out, solver status, bytes read or written) to the metrics sinks.
+#With no sink added a span is a shared no-op object, so instrumentation costs next to nothing.
+#Spans opened in other threads (child_spans) & in joblib worker processes (traced_parallel)
+#are recorded as children of the span which started them.
+_METRICS_SINKS = []
+_SPAN_STACK = threading.local()
+
+def _span_stack():
+    """Returns the open spans of this thread, innermost last"""
+    if not hasattr(_SPAN_STACK, 'spans'):
+        _SPAN_STACK.spans = []
+    return _SPAN_STACK.spans
+
+class _NullSpan:
+    """Span used while no sink is added, records nothing"""
+    enabled = False
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    """Times a stage & collects its attributes, on exit one record is sent to each sink 
+    with the 'span' path (nested spans are joined by '/'), 'start', 'wall_s', the 
+    attributes & the 'error' if the stage raised.
+    Parameters
+    ----------
+    name : str
+        The name of the stage
+    attrs : dict
+        Attributes known when the stage starts
+    """
+    enabled = True
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+
+    def set(self, **attrs):
+        """Adds attributes to the record of the span"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _span_stack()
+        self.path = self.name if len(stack) == 0 else stack[-1].path+'/'+self.name
+        stack.append(self)
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_s = time.perf_counter() - self._perf_start
+        _span_stack().pop()
+        record = {'span': self.path, 'start': self.start, 'wall_s': wall_s}
+        record.update(self.attrs)
+        if exc_type is not None:
+            record['error'] = repr(exc)
+        for sink in list(_METRICS_SINKS):
+            sink.emit(record)
+        return False
+
+def span(name, **attrs):
+    """Returns a context manager timing the stage in its block, 
+    a no-op if no metrics sink has been added.
+    Parameters
+    ----------
+    name : str
+        The name of the stage
+    **attrs : 
+        Attributes known when the stage starts, more can be added with set()
+
+    Returns
+    -------
+    Span 
+        e.g. with span('load', exchange=exchange) as sp: ... sp.set(rows_out=len(df))
+    """
+    if len(_METRICS_SINKS) == 0:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+def current_span():
+    """Returns the innermost open span of this thread, so a @timed function
+    can add attributes to its own span, a no-op span if there is none"""
+    stack = _span_stack()
+    return stack[-1] if len(stack) > 0 and len(_METRICS_SINKS) > 0 else _NULL_SPAN
+
+class _ParentSpan:
+    """Stands in on a thread's span stack for a span open in another thread 
+    or process, so the spans opened under it are recorded as its children"""
+    enabled = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def set(self, **attrs):
+        pass
+
+class child_spans:
+    """Context manager recording the spans opened in its block as children 
+    of parent, a span open in another thread, e.g. run by a thread pool:
+    parent = current_span() ... with child_spans(parent): ...
+    Parameters
+    ----------
+    parent : Span or str
+        The span, or its path, the spans are recorded under
+    """
+    def __init__(self, parent):
+        self.path = parent if isinstance(parent, str) or parent is None else getattr(parent, 'path', None)
+
+    def __enter__(self):
+        if self.path is not None:
+            _span_stack().append(_ParentSpan(self.path))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.path is not None:
+            _span_stack().pop()
+        return False
+
+def _traced_task(parent, pid, fn, args, kwargs):
+    """Runs a joblib task under the parent span path, in a worker process the
+    spans are collected & returned with the result to be emitted by the parent"""
+    if os.getpid() == pid:
+        with child_spans(parent):
+            return fn(*args, **kwargs), []
+    sink = add_metrics_sink(MemorySink())
+    try:
+        with child_spans(parent):
+            result = fn(*args, **kwargs)
+    finally:
+        remove_metrics_sink(sink)
+    return result, sink.records
+
+def traced_parallel(parallel, tasks):
+    """Runs joblib delayed tasks on parallel, a joblib Parallel, recording 
+    the spans opened by the tasks in the worker processes to this process's 
+    sinks as children of the current span.
+    Parameters
+    ----------
+    parallel : Parallel
+        e.g. Parallel(n_jobs=-1)
+    tasks : iterable
+        The delayed(fn)(*args, **kwargs) tasks to run
+
+    Returns
+    -------
+    list 
+        The results of the tasks, in order
+    """
+    if len(_METRICS_SINKS) == 0:
+        return parallel(tasks)
+    parent = current_span()
+    parent = getattr(parent, 'path', None)
+    outputs = parallel((_traced_task, (parent, os.getpid(), fn, args, kwargs), {}) for fn, args, kwargs in tasks)
+    results = []
+    for result, records in outputs:
+        for record in records:
+            for sink in list(_METRICS_SINKS):
+                sink.emit(record)
+        results.append(result)
+    return results
+
+def timed(name=None):
+    """Decorator wrapping each call of a function in a span named name, 
+    the function's name if None"""
+    def decorate(fn):
+        span_name = fn.__name__ if name is None else name
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if len(_METRICS_SINKS) == 0:
+                return fn(*args, **kwargs)
+            with Span(span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+#Metrics sinks, a sink only needs an emit(record) method
+class MemorySink:
+    """Collects the span records in memory, see to_frame"""
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def to_frame(self):
+        """Returns the records as a DataFrame, one row per span"""
+        import pandas as pd
+        return pd.DataFrame(self.records)
+
+    def clear(self):
+        self.records = []
+
+class JsonLinesSink:
+    """Appends each span record as a line of json to a file
+    Parameters
+    ----------
+    filename : str
+        The file the records are appended to
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, default=str)+'\n'
+        with self._lock:
+            with open(self.filename, 'a') as f:
+                f.write(line)
+
+class LoggingSink:
+    """Logs each span record as one line
+    Parameters
+    ----------
+    logger : Logger, optional
+        The logger to use, this module's logger if None
+    level : int
+        The level the records are logged at
+    """
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logging.getLogger(__name__) if logger is None else logger
+        self.level = level
+
+    def emit(self, record):
+        attrs = ' '.join(str(k)+'='+str(v) for k, v in record.items() if k not in ['span', 'start', 'wall_s'])
+        self.logger.log(self.level, '%s %.4fs %s', record['span'], record['wall_s'], attrs)
+
+def add_metrics_sink(sink):
+    """Sends the records of all spans to sink until it is removed, returns sink"""
+    _METRICS_SINKS.append(sink)
+    return sink
+
+def remove_metrics_sink(sink):
+    """Stops sending span records to sink"""
+    if sink in _METRICS_SINKS:
+        _METRICS_SINKS.remove(sink)
+
+class metrics_sink:
+    """Context manager adding a sink for the duration of its block, 
+    e.g. with metrics_sink(MemorySink()) as sink: ... sink.to_frame()"""
+    def __init__(self, sink=None):
+        self.sink = MemorySink() if sink is None else sink
+
+    def __enter__(self):
+        return add_metrics_sink(self.sink)
+
+    def __exit__(self, exc_type, exc, tb):
+        remove_metrics_sink(self.sink)
+        return False
+
+def _frame_shape(df, suffix):
+    """Returns the rows & columns of a frame as span attributes"""
+    return {'rows_'+suffix: df.shape[0], 'columns_'+suffix: df.shape[1] if df.ndim > 1 else 1}
+
+def _solver_stats(problem):
+    """Returns the status & iteration count of a solved cvxpy problem as span attributes"""
+    if problem is None:
+        return {}
+    stats = {'solver_status': problem.status}
+    if problem.solver_stats is not None:
+        stats.update({'solver': problem.solver_stats.solver_name,
+                      'solver_iterations': problem.solver_stats.num_iters,
+                      'solve_time_s': problem.solver_stats.solve_time})
+    return stats
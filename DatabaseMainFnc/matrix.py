@@ -0,0 +1,314 @@
+#Memory-mapped price matrix & its availability index
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from .instrument import current_span, timed
+from .store import _store_path, read_store_manifest, load_store
+
+#Memory-mapped price matrix functions
+
+#A float32 copy of the store kept as one raw row-major (dates x tickers) file, 
+#with the dates & tickers in sidecar files. Worker processes that open it share
+#the same physical pages & date ranges are sliced as views rather than copies.
+def _matrix_paths(exchange):
+    """Returns the paths of the matrix values, dates & metadata files of an exchange"""
+    store = _store_path(exchange)
+    return (os.path.join(store, 'matrix.f32'),
+            os.path.join(store, 'matrix_dates.npy'),
+            os.path.join(store, 'matrix.json'))
+
+def _read_matrix_meta(exchange):
+    """Reads the metadata of an exchange's price matrix, None if it has not been built"""
+    meta_path = _matrix_paths(exchange)[2]
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+def _write_matrix_meta(meta, exchange):
+    """Atomically replaces the metadata of an exchange's price matrix"""
+    meta_path = _matrix_paths(exchange)[2]
+    with open(meta_path+'.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path+'.tmp', meta_path)
+
+def _write_matrix_dates(dates, dates_path):
+    """Atomically replaces the dates of an exchange's price matrix"""
+    #np.save would add .npy to a .tmp filename
+    with open(dates_path+'.tmp', 'wb') as f:
+        np.save(f, dates)
+    os.replace(dates_path+'.tmp', dates_path)
+
+@timed()
+def build_price_matrix(exchange):
+    """Builds or updates the memory-mapped float32 price matrix of an exchange 
+    from its price store. If only new partitions have been appended since the 
+    last build & they hold no new tickers, their rows are appended to the matrix,
+    otherwise the matrix is rebuilt.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    """
+    values_path, dates_path, _ = _matrix_paths(exchange)
+    manifest = read_store_manifest(exchange)
+    if manifest is None:
+        raise FileNotFoundError('No price store found at: '+_store_path(exchange))
+    meta = _read_matrix_meta(exchange)
+    if meta is not None and meta['version'] == manifest['version']:
+        return
+
+    part_files = [part['file'] for part in manifest['partitions']]
+    if meta is not None and part_files[:len(meta['partitions'])] == meta['partitions']:
+        new_parts = part_files[len(meta['partitions']):]
+        new_rows = [pd.read_parquet(os.path.join(_store_path(exchange), f)) for f in new_parts]
+        new_rows = pd.concat(new_rows, axis=0, sort=False) if len(new_rows) > 0 else pd.DataFrame()
+        if set(new_rows.columns) <= set(meta['tickers']):
+            block = new_rows.reindex(columns=meta['tickers']).to_numpy(dtype='float32')
+            row_bytes = 4 * len(meta['tickers'])
+            with open(values_path, 'r+b') as f:
+                #drop anything left over from an interrupted append before adding the rows
+                f.truncate(meta['n_dates'] * row_bytes)
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(block).tobytes())
+            dates = np.concatenate([np.load(dates_path), new_rows.index.values.astype('datetime64[D]')])
+            _write_matrix_dates(dates, dates_path)
+            meta.update({'version': manifest['version'], 'n_dates': len(dates), 'partitions': part_files})
+            _write_matrix_meta(meta, exchange)
+            current_span().set(rows_appended=len(block), bytes_written=block.nbytes)
+            return
+
+    database = load_store(exchange)
+    values = database.to_numpy(dtype='float32')
+    current_span().set(rows_out=values.shape[0], columns_out=values.shape[1], bytes_written=values.nbytes)
+    #write to a temporary file so processes with the old matrix open keep a valid mapping
+    values.tofile(values_path+'.tmp')
+    os.replace(values_path+'.tmp', values_path)
+    _write_matrix_dates(database.index.values.astype('datetime64[D]'), dates_path)
+    _write_matrix_meta({'version': manifest['version'],
+                        'n_dates': len(database),
+                        'tickers': database.columns.tolist(),
+                        'partitions': part_files}, exchange)
+
+class PriceMatrix:
+    """Read-only, memory-mapped float32 matrix of prices (dates x tickers)
+    with NaN for missing prices. Date ranges are sliced as views of the
+    mapped file so several processes can share one copy of the prices.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    """
+    def __init__(self, exchange):
+        values_path, dates_path, _ = _matrix_paths(exchange)
+        meta = _read_matrix_meta(exchange)
+        if meta is None:
+            raise FileNotFoundError('No price matrix built for: '+str(exchange))
+        self.exchange = exchange
+        self.version = meta['version']
+        #the store partitions the matrix was built from, it keeps reading these after later updates
+        self.partitions = meta['partitions']
+        self.dates = pd.DatetimeIndex(np.load(dates_path)[:meta['n_dates']], name='Date')
+        self.tickers = pd.Index(meta['tickers'])
+        self.values = np.memmap(values_path, dtype='float32', mode='r',
+                                shape=(meta['n_dates'], len(meta['tickers'])))
+
+        self._availability = None
+        self._quality = None
+
+    def __len__(self):
+        return len(self.dates)
+
+    def availability(self):
+        """Returns the AvailabilityIndex of this version of the matrix, 
+        None if it has not been built"""
+        if self._availability is None:
+            meta = _read_availability_meta(self.exchange)
+            if meta is not None and meta['version'] == self.version:
+                self._availability = AvailabilityIndex(self.exchange)
+        return self._availability
+
+    def quality(self):
+        """Returns the DataQuality of this version of the matrix, 
+        None if it has not been built"""
+        if self._quality is None:
+            from .quality import DataQuality, _read_quality_meta
+            meta = _read_quality_meta(self.exchange)
+            if meta is not None and meta['version'] == self.version:
+                self._quality = DataQuality(self.exchange)
+        return self._quality
+
+    def __reduce__(self):
+        #pickle by exchange name so worker processes re-map the file rather than copy the prices
+        return (PriceMatrix, (self.exchange,))
+
+    def _columns(self, tickers):
+        """Returns the column positions of tickers, raising a KeyError for any not in the matrix"""
+        columns = self.tickers.get_indexer(tickers)
+        if (columns < 0).any():
+            raise KeyError('Tickers not in the price matrix: '+str([t for t, c in zip(tickers, columns) if c < 0]))
+        return columns
+
+    def _rows(self, startdate, enddate):
+        """Returns the row slice of the dates between startdate & enddate inclusive"""
+        start = 0 if startdate is None else self.dates.searchsorted(pd.to_datetime(startdate), side='left')
+        end = len(self.dates) if enddate is None else self.dates.searchsorted(pd.to_datetime(enddate), side='right')
+        return slice(start, end)
+
+    def window(self, startdate=None, enddate=None, tickers=None):
+        """Returns the prices between startdate & enddate (inclusive) as a DataFrame 
+        which can be passed straight to expected_returns & risk_models.
+        Without tickers the frame is a view of the mapped file, with tickers 
+        only the selected columns are copied.
+        Parameters
+        ----------
+        startdate, enddate : str, optional
+            'YYYY-MM-DD' bounds of the window, open ended if None
+        tickers : list, optional
+            The tickers to select, all tickers if None, a KeyError is 
+            raised for tickers not in the matrix
+
+        Returns
+        -------
+        DataFrame 
+            float32 prices indexed by 'Date' with a column per ticker
+        """
+        rows = self._rows(startdate, enddate)
+        if tickers is None:
+            values = self.values[rows]
+            columns = self.tickers
+        else:
+            columns = pd.Index(tickers)
+            values = self.values[rows][:, self._columns(columns)]
+        return pd.DataFrame(values, index=self.dates[rows], columns=columns, copy=False)
+
+    def last_prices(self):
+        """Returns the most recent row of prices as a Series indexed by ticker"""
+        return pd.Series(self.values[-1], index=self.tickers)
+
+def open_price_matrix(exchange, refresh=True):
+    """Opens the memory-mapped price matrix of an exchange.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    refresh : Boolean
+        True: builds or updates the matrix & its availability & quality
+        indexes to the latest store version first
+        False: opens the matrix as last built
+
+    Returns
+    -------
+    PriceMatrix 
+        The read-only price matrix of the exchange
+    """
+    if refresh == True:
+        build_price_matrix(exchange)
+        build_availability_index(exchange)
+        #imported here as the quality index is built from the matrix
+        from .quality import build_quality_index
+        build_quality_index(exchange)
+    return PriceMatrix(exchange)
+
+#Availability index functions
+
+#Per ticker cumulative valid row counts of the price matrix, so the screens of a 
+#window are answered by lookups into the counts rather than by scanning the window's prices.
+def _availability_paths(exchange):
+    """Returns the paths of the counts & metadata files of an exchange's availability index"""
+    store = _store_path(exchange)
+    return (os.path.join(store, 'availability_counts.i32'),
+            os.path.join(store, 'availability.json'))
+
+def _read_availability_meta(exchange):
+    """Reads the metadata of an exchange's availability index, None if it has not been built"""
+    meta_path = _availability_paths(exchange)[1]
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+@timed()
+def build_availability_index(exchange, chunk_rows=256):
+    """Builds or updates the availability index of an exchange's price matrix.
+    If rows have only been appended to the matrix since the last build just 
+    the new rows are scanned, otherwise the index is rebuilt.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    chunk_rows : int
+        The number of matrix rows scanned at a time
+    """
+    counts_path, meta_path = _availability_paths(exchange)
+    matrix_meta = _read_matrix_meta(exchange)
+    if matrix_meta is None:
+        raise FileNotFoundError('No price matrix built for: '+str(exchange))
+    meta = _read_availability_meta(exchange)
+    if meta is not None and meta['version'] == matrix_meta['version']:
+        return
+
+    matrix = PriceMatrix(exchange)
+    n_tickers = len(matrix.tickers)
+    if (meta is not None and meta['tickers'] == matrix_meta['tickers'] 
+            and matrix_meta['partitions'][:len(meta['partitions'])] == meta['partitions']):
+        start = meta['n_dates']
+        #only the counts of the last indexed row are needed to carry on
+        running = np.fromfile(counts_path, dtype='int32', offset=start*n_tickers*4, count=n_tickers)
+        mode = 'r+b'
+    else:
+        start = 0
+        running = np.zeros(n_tickers, dtype='int32')
+        mode = 'w+b'
+
+    with open(counts_path+('' if mode == 'r+b' else '.tmp'), mode) as f:
+        if mode == 'r+b':
+            #drop anything left over from an interrupted update before adding the rows
+            f.truncate((start+1) * n_tickers * 4)
+            f.seek(0, os.SEEK_END)
+        else:
+            f.write(running.tobytes())
+        for chunk_start in range(start, len(matrix), chunk_rows):
+            block = np.asarray(matrix.values[chunk_start:chunk_start+chunk_rows])
+            valid = ~np.isnan(block)
+            cum = running + np.cumsum(valid, axis=0, dtype='int32')
+            f.write(cum.tobytes())
+            running = cum[-1]
+    if mode == 'w+b':
+        os.replace(counts_path+'.tmp', counts_path)
+
+    with open(meta_path+'.tmp', 'w') as f:
+        json.dump({'version': matrix_meta['version'], 'n_dates': len(matrix),
+                   'tickers': matrix_meta['tickers'], 'partitions': matrix_meta['partitions']}, f)
+    os.replace(meta_path+'.tmp', meta_path)
+
+class AvailabilityIndex:
+    """Per ticker availability of an exchange's price matrix: the cumulative 
+    count of valid rows, so the number of valid prices of every ticker in any 
+    window is two row lookups.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    """
+    def __init__(self, exchange):
+        counts_path, _ = _availability_paths(exchange)
+        meta = _read_availability_meta(exchange)
+        if meta is None:
+            raise FileNotFoundError('No availability index built for: '+str(exchange))
+        self.version = meta['version']
+        self.tickers = pd.Index(meta['tickers'])
+        self.valid_counts = np.memmap(counts_path, dtype='int32', mode='r',
+                                      shape=(meta['n_dates']+1, len(meta['tickers'])))
+
+    def valid_rows(self, start, end):
+        """Returns the number of valid prices of each ticker in matrix rows start to end-1"""
+        return np.asarray(self.valid_counts[end]) - np.asarray(self.valid_counts[start])
@@ -0,0 +1,336 @@
+#Efficient frontier optimisers
+import inspect
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import cvxpy as cp
+from pypfopt.efficient_frontier import EfficientFrontier
+from pypfopt import base_optimizer
+from pypfopt.exceptions import OptimizationError
+
+from .instrument import current_span, timed, _solver_stats
+from .estimation import FactorRiskModel
+
+#Optimisation functions
+
+#pypfopt changed its default risk free rate between versions so follow whichever is installed
+DEFAULT_RISK_FREE_RATE = inspect.signature(base_optimizer.portfolio_performance).parameters['risk_free_rate'].default
+
+class ParametricFrontier:
+    """Efficient frontier optimiser whose cvxpy problems are compiled once for a 
+    number of assets, with mu, the covariance factor & the targets held as 
+    cp.Parameters. Re-solving for a new window only updates the parameter values 
+    & is warm-started from the previous window's weights. Mirrors the methods of 
+    pypfopt's EfficientFrontier with long only (0, 1) weight bounds.
+    Parameters
+    ----------
+    n_assets : int
+        The number of assets the problems are compiled for
+    solver : str, optional
+        The cvxpy solver to use, cvxpy chooses if None
+    """
+    def __init__(self, n_assets, solver=None):
+        self.n_assets = n_assets
+        self.solver = solver
+        self._w = cp.Variable(n_assets)
+        self._mu = cp.Parameter(n_assets)
+        self._mu_excess = cp.Parameter(n_assets)
+        self._target = cp.Parameter()
+        self._target_variance = cp.Parameter(nonneg=True)
+        self._variance = self._make_variance()
+        self._problems = {}
+        self.tickers = None
+        self.expected_returns = None
+        self.cov_matrix = None
+        self.weights = None
+
+    def _make_variance(self):
+        """Returns the portfolio variance as a DPP expression of the weights"""
+        #variance is kept as |Fw|^2 with F = sqrt(eigenvalues) * eigenvectors' so the problems stay DPP
+        self._cov_factor = cp.Parameter((self.n_assets, self.n_assets))
+        return cp.sum_squares(self._cov_factor @ self._w)
+
+    def _set_risk(self, cov_matrix):
+        """Sets the covariance parameters from the covariance matrix"""
+        self.cov_matrix = np.asarray(cov_matrix, dtype='float64')
+        eigvals, eigvecs = np.linalg.eigh(self.cov_matrix)
+        self._cov_factor.value = (eigvecs * np.sqrt(np.clip(eigvals, 0, None))).T
+
+    def _global_min_volatility(self):
+        """Returns the volatility of the unconstrained minimum variance portfolio"""
+        return np.sqrt(1 / np.sum(np.linalg.pinv(self.cov_matrix)))
+
+    def _problem(self, objective):
+        """Returns the compiled problem of an objective, building it on first use"""
+        if objective not in self._problems:
+            w = self._w
+            variance = self._variance
+            weight_constraints = [cp.sum(w) == 1, w >= 0, w <= 1]
+            if objective == 'MIN_VOL':
+                problem = cp.Problem(cp.Minimize(variance), weight_constraints)
+            elif objective == 'RETURN':
+                problem = cp.Problem(cp.Minimize(variance), 
+                                     weight_constraints + [self._mu @ w >= self._target])
+            elif objective == 'RISK':
+                problem = cp.Problem(cp.Maximize(self._mu @ w), 
+                                     weight_constraints + [variance <= self._target_variance])
+            elif objective == 'SHARPE':
+                #the usual transform of max sharpe into a convex problem, weights are w/k
+                k = cp.Variable(nonneg=True)
+                problem = cp.Problem(cp.Minimize(variance), 
+                                     [self._mu_excess @ w == 1, cp.sum(w) == k, w >= 0, w <= k])
+                problem.k = k
+            self._problems[objective] = problem
+        return self._problems[objective]
+
+    def set_inputs(self, expected_returns, cov_matrix, risk_free_rate=DEFAULT_RISK_FREE_RATE):
+        """Sets mu & the covariance matrix of the next window to optimise.
+        Parameters
+        ----------
+        expected_returns : Series
+            Expected annual returns indexed by ticker
+        cov_matrix : DataFrame or FactorRiskModel
+            Annual covariance matrix indexed by ticker, 
+            a FactorRiskModel for a FactorFrontier
+        risk_free_rate : float
+            The risk free rate used by max_sharpe
+
+        Returns
+        -------
+        ParametricFrontier 
+            self, so a solve can be chained e.g. pf.set_inputs(mu, S).max_sharpe()
+        """
+        if len(expected_returns) != self.n_assets:
+            raise ValueError('ParametricFrontier was compiled for '+str(self.n_assets)+' assets')
+        #warm start from the last window's weights of any tickers still in the universe
+        if self.weights is not None:
+            w_prev = pd.Series(self.weights, index=self.tickers).reindex(expected_returns.index).fillna(0)
+            if w_prev.sum() > 0:
+                self._w.value = (w_prev / w_prev.sum()).values
+
+        self.tickers = list(expected_returns.index)
+        self.expected_returns = np.asarray(expected_returns, dtype='float64')
+        self.risk_free_rate = risk_free_rate
+        self._set_risk(cov_matrix)
+        self._mu.value = self.expected_returns
+        self._mu_excess.value = self.expected_returns - risk_free_rate
+        return self
+
+    @timed('solve')
+    def _solve(self, objective):
+        """Solves the compiled problem of an objective with the current parameters"""
+        problem = self._problem(objective)
+        try:
+            problem.solve(solver=self.solver, warm_start=True)
+        except (TypeError, cp.DCPError, cp.SolverError) as e:
+            raise OptimizationError from e
+        current_span().set(objective=objective, n_assets=self.n_assets, **_solver_stats(problem))
+        if problem.status not in {'optimal', 'optimal_inaccurate'}:
+            raise OptimizationError('Solver status: {}'.format(problem.status))
+        weights = self._w.value
+        if objective == 'SHARPE':
+            weights = weights / problem.k.value
+        self.weights = weights.round(16) + 0.0
+        return OrderedDict(zip(self.tickers, self.weights))
+
+    def max_sharpe(self):
+        """Maximises the Sharpe ratio, as EfficientFrontier.max_sharpe"""
+        if not (self.expected_returns - self.risk_free_rate > 0).any():
+            raise ValueError('at least one of the assets must have an expected return exceeding the risk-free rate')
+        return self._solve('SHARPE')
+
+    def min_volatility(self):
+        """Minimises volatility, as EfficientFrontier.min_volatility"""
+        return self._solve('MIN_VOL')
+
+    def efficient_risk(self, target_volatility):
+        """Maximises return for a target volatility, as EfficientFrontier.efficient_risk"""
+        if not isinstance(target_volatility, (float, int)) or target_volatility < 0:
+            raise ValueError('target_volatility should be a positive float')
+        global_min_volatility = self._global_min_volatility()
+        if target_volatility < global_min_volatility:
+            raise ValueError('The minimum volatility is {:.3f}. Please use a higher target_volatility'.format(global_min_volatility))
+        self._target_variance.value = target_volatility**2
+        return self._solve('RISK')
+
+    def efficient_return(self, target_return):
+        """Minimises volatility for a target return, as EfficientFrontier.efficient_return"""
+        if not isinstance(target_return, float):
+            raise ValueError('target_return should be a float')
+        #with long only weights summing to 1 the maximum return is that of the best asset
+        if target_return > self.expected_returns.max():
+            raise ValueError('target_return must be lower than the maximum possible return')
+        self._target.value = target_return
+        return self._solve('RETURN')
+
+    def clean_weights(self, cutoff=1e-4, rounding=5):
+        """Zeroes weights below cutoff & rounds the rest, as EfficientFrontier.clean_weights"""
+        if self.weights is None:
+            raise AttributeError('Weights not yet computed')
+        clean_weights = self.weights.copy()
+        clean_weights[np.abs(clean_weights) < cutoff] = 0
+        if rounding is not None:
+            clean_weights = np.round(clean_weights, rounding)
+        return OrderedDict(zip(self.tickers, clean_weights))
+
+    def portfolio_performance(self, verbose=False, risk_free_rate=DEFAULT_RISK_FREE_RATE):
+        """Returns the (expected return, volatility, Sharpe ratio) of the last solve, 
+        as EfficientFrontier.portfolio_performance"""
+        return base_optimizer.portfolio_performance(self.weights, self.expected_returns, self.cov_matrix,
+                                                    verbose=verbose, risk_free_rate=risk_free_rate)
+
+class FactorFrontier(ParametricFrontier):
+    """ParametricFrontier over a FactorRiskModel, the variance is held in 
+    factored form |F'w|^2 + |sqrt(D)w|^2 so solve time grows with the number
+    of assets times the number of factors rather than the number of assets squared.
+    Parameters
+    ----------
+    n_assets : int
+        The number of assets the problems are compiled for
+    n_factors : int
+        The number of factors the problems are compiled for
+    solver : str, optional
+        The cvxpy solver to use, cvxpy chooses if None
+    """
+    def __init__(self, n_assets, n_factors, solver=None):
+        self.n_factors = n_factors
+        super().__init__(n_assets, solver)
+
+    def _make_variance(self):
+        """Returns the factored portfolio variance as a DPP expression of the weights"""
+        self._loadings = cp.Parameter((self.n_assets, self.n_factors))
+        self._idiosyncratic_sd = cp.Parameter(self.n_assets, nonneg=True)
+        return cp.sum_squares(self._loadings.T @ self._w) + cp.sum_squares(cp.multiply(self._idiosyncratic_sd, self._w))
+
+    def _set_risk(self, cov_matrix):
+        """Sets the loadings & idiosyncratic parameters from a FactorRiskModel"""
+        self.cov_matrix = cov_matrix
+        self._loadings.value = cov_matrix.loadings.to_numpy(dtype='float64')
+        self._idiosyncratic_sd.value = np.sqrt(cov_matrix.idiosyncratic.to_numpy(dtype='float64'))
+
+    def _global_min_volatility(self):
+        return self.cov_matrix.global_min_volatility()
+
+    def portfolio_performance(self, verbose=False, risk_free_rate=DEFAULT_RISK_FREE_RATE):
+        """Returns the (expected return, volatility, Sharpe ratio) of the last solve, 
+        as EfficientFrontier.portfolio_performance"""
+        mu = self.expected_returns @ self.weights
+        sigma = np.sqrt(self.cov_matrix.variance(self.weights))
+        sharpe = (mu - risk_free_rate) / sigma
+        if verbose:
+            print("Expected annual return: {:.1f}%".format(100 * mu))
+            print("Annual volatility: {:.1f}%".format(100 * sigma))
+            print("Sharpe Ratio: {:.2f}".format(sharpe))
+        return mu, sigma, sharpe
+
+#compiled ParametricFrontiers of this process, one per number of assets (& factors)
+_PARAMETRIC_FRONTIERS = {}
+
+def get_parametric_frontier(mu, S):
+    """Returns this process's ParametricFrontier compiled for the number of assets 
+    in mu, or FactorFrontier for a FactorRiskModel S, with mu & S set as its inputs.
+    Parameters
+    ----------
+    mu : Series
+        Expected annual returns indexed by ticker
+    S : DataFrame or FactorRiskModel
+        Annual covariance matrix indexed by ticker
+
+    Returns
+    -------
+    ParametricFrontier 
+        The compiled optimiser ready to solve
+    """
+    if isinstance(S, FactorRiskModel):
+        key = (len(mu), S.n_factors)
+        if key not in _PARAMETRIC_FRONTIERS:
+            _PARAMETRIC_FRONTIERS[key] = FactorFrontier(len(mu), S.n_factors)
+    else:
+        key = len(mu)
+        if key not in _PARAMETRIC_FRONTIERS:
+            _PARAMETRIC_FRONTIERS[key] = ParametricFrontier(len(mu))
+    return _PARAMETRIC_FRONTIERS[key].set_inputs(mu, S)
+
+#Solves one objective for an estimated mu & S
+@timed('optimise')
+def optimise_portfolio(mu, S, obj_method='SHARPE', target_percent=0.1, optimiser='PYPFOPT'):
+    """Creates the efficient frontier optimiser for mu & S & solves it for obj_method.
+    Parameters
+    ----------
+    mu : Series
+        Expected annual returns indexed by ticker
+    S : DataFrame or FactorRiskModel
+        Annual covariance of the stocks, a FactorRiskModel is always 
+        solved by a FactorFrontier
+    obj_method, target_percent, optimiser : 
+        As in portfolio_generate_test
+
+    Returns
+    -------
+    ef : EfficientFrontier or ParametricFrontier 
+        The solved optimiser, see clean_weights & portfolio_performance
+    objective_summary : str 
+        Description of the objective used for the output df
+    """
+    if optimiser == 'PARAMETRIC' or isinstance(S, FactorRiskModel):
+        ef= get_parametric_frontier(mu, S) #Reuse the compiled Efficient Frontier problems
+    else:
+        ef= EfficientFrontier(mu, S) #Create the Efficient Frontier Object
+
+    objective_summary=obj_method #description of the objective we used for our output df
+    if obj_method == "SHARPE":
+        ef.max_sharpe()
+
+    elif obj_method == "MIN_VOL":
+        ef.min_volatility()
+
+    elif obj_method == "RISK":
+        objective_summary=obj_method+"_"+str(target_percent)
+        ef.efficient_risk(target_percent)
+
+    elif obj_method == "RETURN":
+        objective_summary=obj_method+"_"+str(target_percent)
+        ef.efficient_return(target_percent)
+
+    else:   
+        print("obj_method must be one of SHARPE, MIN_VOL, RISK, RETURN")
+    current_span().set(objective=objective_summary, optimiser=type(ef).__name__, n_assets=len(mu),
+                       **_solver_stats(getattr(ef, '_opt', None)))
+    return ef, objective_summary
+
+#Solves run by the worker processes of the batch runners & the service, kept here so
+#a spawned worker only imports the optimisers
+
+def _start_worker():
+    """Run as a spawned solve worker starts, so the optimisers are imported 
+    (by unpickling this function) before its first solve"""
+    return None
+
+def _solve_frontier_points(mu, S, targets, target_type):
+    """Solves a list of frontier targets against one compiled ParametricFrontier,
+    infeasible targets are flagged rather than raised"""
+    ef = get_parametric_frontier(mu, S)
+    rows = []
+    for target in targets:
+        try:
+            if target_type == 'RISK':
+                ef.efficient_risk(float(target))
+            else:
+                ef.efficient_return(float(target))
+            rows.append([target, ef.clean_weights()] + list(ef.portfolio_performance()) + [True, None])
+        except (ValueError, OptimizationError) as e:
+            rows.append([target, None, np.nan, np.nan, np.nan, False, str(e)])
+    return rows
+
+def _grid_solve(mu, S, leaves):
+    """Solves the leaves of one estimate, returning [expected_returns, volatility, 
+    sharpe, weights, objective, error] per leaf"""
+    rows = []
+    for obj_method, target_percent, optimiser in leaves:
+        try:
+            ef, objective_summary = optimise_portfolio(mu, S, obj_method, target_percent, optimiser)
+            rows.append(list(ef.portfolio_performance()) + [ef.clean_weights(), objective_summary, None])
+        except Exception as e:
+            rows.append([np.nan]*3 + [None, obj_method, repr(e)])
+    return rows
@@ -0,0 +1,19 @@
+#Plots of portfolio performance, matplotlib is only imported with this module
+import pandas as pd
+import matplotlib.pyplot as plt
+
+def plot_portfolio_returns(portfolio_values, expected_returns):
+    """Plots the actual returns of a portfolio by day against its expected return
+    Parameters
+    ----------
+    portfolio_values : Series
+        The value of the portfolio by day starting at 1, see weighted_values
+    expected_returns : float
+        The expected annual return of the portfolio
+    """
+    #Create dataframe for graph
+    df_graph=pd.DataFrame(portfolio_values.rename('Actual_Returns'))
+    df_graph['Actual_Returns']=df_graph['Actual_Returns']-1
+    df_graph['Expected_Returns']=expected_returns
+    df_graph.plot(figsize=(10,5))
+    plt.show()
@@ -0,0 +1,264 @@
+#Incremental data quality scanning of the price matrix
+import os
+import json
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .instrument import timed
+from .store import _store_path
+from .matrix import PriceMatrix, _read_matrix_meta
+
+#Data quality functions
+
+#Each (date, ticker) of the price matrix gets a byte of flags, appended as rows arrive,
+#with per ticker counts of each flag & the state needed to carry the checks on to the
+#next rows, so updates only scan the new rows & screens read the flags of a window.
+QUALITY_FLAGS = OrderedDict([('negative', 1),  #price below 0
+                             ('zero', 2),      #price of exactly 0
+                             ('stale', 4),     #price unchanged for stale_run or more valid rows
+                             ('jump', 8),      #split-like move from the previous valid price
+                             ('gap', 16)])     #missing price after the first valid price
+
+def _quality_paths(exchange):
+    """Returns the paths of the mask, summary & metadata files of an exchange's quality index"""
+    store = _store_path(exchange)
+    return (os.path.join(store, 'quality_mask.u1'),
+            os.path.join(store, 'quality.npz'),
+            os.path.join(store, 'quality.json'))
+
+def _read_quality_meta(exchange):
+    """Reads the metadata of an exchange's quality index, None if it has not been built"""
+    meta_path = _quality_paths(exchange)[2]
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+def _new_quality_state(n_tickers):
+    """Returns the per ticker scan state of a ticker with no rows scanned yet"""
+    return {'last_price': np.full(n_tickers, np.nan, dtype='float64'),
+            'run': np.zeros(n_tickers, dtype='int64'),
+            'seen': np.zeros(n_tickers, dtype=bool),
+            'prev_valid': np.ones(n_tickers, dtype=bool),
+            'flag_counts': np.zeros((len(QUALITY_FLAGS), n_tickers), dtype='int64'),
+            'gaps': np.zeros(n_tickers, dtype='int64')}
+
+def _scan_quality_block(block, state, stale_run=5, jump_ratio=1.8):
+    """Flags a block of rows (dates x tickers) in one vectorised pass given the 
+    state carried from the rows before it, updates the state in place & 
+    returns the uint8 mask of the block"""
+    block = np.asarray(block, dtype='float64')
+    if len(block) == 0:
+        return np.zeros(block.shape, dtype='uint8')
+    valid = ~np.isnan(block)
+    rows = np.arange(len(block)+1)[:, None]
+
+    #the previous valid price of every row, carried on from the last block
+    ext = np.vstack([state['last_price'][None], block])
+    idx = np.maximum.accumulate(np.where(~np.isnan(ext), rows, 0), axis=0)
+    prev = np.take_along_axis(ext, idx, axis=0)[:-1]
+
+    #length of the run of unchanged valid prices ending at each row, missing rows don't break a run
+    same = valid & (block == prev)
+    counter = state['run'] + np.cumsum(same, axis=0)
+    run = counter - np.maximum.accumulate(np.where(valid & ~same, counter, 0), axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = block / prev
+    jump = valid & (prev > 0) & (block > 0) & ((ratio > jump_ratio) | (ratio < 1 / jump_ratio))
+
+    seen = state['seen'] | np.logical_or.accumulate(valid, axis=0)
+    prev_seen = np.vstack([state['seen'][None], seen[:-1]])
+    prev_valid = np.vstack([state['prev_valid'][None], valid[:-1]])
+
+    flags = [valid & (block < 0), 
+             valid & (block == 0), 
+             valid & (run >= stale_run - 1), 
+             jump, 
+             ~valid & seen]
+    mask = np.zeros(block.shape, dtype='uint8')
+    for i, (flag, bit) in enumerate(zip(flags, QUALITY_FLAGS.values())):
+        mask |= (flag * bit).astype('uint8')
+        state['flag_counts'][i] += flag.sum(axis=0)
+    #a gap is counted once a valid price closes it
+    state['gaps'] += (valid & ~prev_valid & prev_seen).sum(axis=0)
+
+    state['last_price'] = prev[-1] if not valid[-1].any() else np.where(valid[-1], block[-1], prev[-1])
+    state['run'] = run[-1]
+    state['seen'] = seen[-1]
+    state['prev_valid'] = valid[-1]
+    return mask
+
+def _quality_summary(state, tickers):
+    """Returns the per ticker counts of a scan state as a DataFrame"""
+    summary = pd.DataFrame(state['flag_counts'].T, index=pd.Index(tickers), columns=list(QUALITY_FLAGS))
+    summary['gaps'] = state['gaps']
+    summary['last_price'] = state['last_price']
+    return summary
+
+def _flag_bits(flags):
+    """Returns the bits of flags given as an int or a list of QUALITY_FLAGS names"""
+    if isinstance(flags, (int, np.integer)):
+        return int(flags)
+    return int(sum(QUALITY_FLAGS[flag] for flag in flags))
+
+def scan_quality(database, stale_run=5, jump_ratio=1.8, chunk_rows=4096):
+    """Scans a DataFrame of prices for data quality issues a block of rows at 
+    a time, carrying the state of the checks from block to block as
+    build_quality_index does for the price store.
+    Parameters
+    ----------
+    database : DataFrame
+        Prices indexed by date with a column per ticker
+    stale_run : int
+        Flags prices once they have been unchanged for this many valid rows
+    jump_ratio : float
+        Flags moves from the previous valid price up by more than this 
+        ratio or down by more than its inverse
+    chunk_rows : int
+        The number of rows scanned at a time
+
+    Returns
+    -------
+    mask : DataFrame 
+        uint8 QUALITY_FLAGS bits of each (date, ticker)
+    summary : DataFrame 
+        Per ticker count of rows with each flag, the number of closed 
+        gaps & the last valid price
+    """
+    state = _new_quality_state(len(database.columns))
+    mask = np.zeros(database.shape, dtype='uint8')
+    for chunk_start in range(0, len(database), chunk_rows):
+        block = database.iloc[chunk_start:chunk_start+chunk_rows].to_numpy(dtype='float64')
+        mask[chunk_start:chunk_start+chunk_rows] = _scan_quality_block(block, state, stale_run, jump_ratio)
+    return (pd.DataFrame(mask, index=database.index, columns=database.columns), 
+            _quality_summary(state, database.columns))
+
+@timed()
+def build_quality_index(exchange, chunk_rows=256, stale_run=5, jump_ratio=1.8):
+    """Builds or updates the data quality index of an exchange's price matrix. 
+    If rows have only been appended to the matrix since the last build just
+    the new rows are scanned, carrying on from the state of the last scan,
+    otherwise the index is rebuilt.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    chunk_rows : int
+        The number of matrix rows scanned at a time
+    stale_run, jump_ratio : 
+        The thresholds of the checks, see scan_quality. Changing 
+        them rebuilds the index
+    """
+    mask_path, state_path, meta_path = _quality_paths(exchange)
+    matrix_meta = _read_matrix_meta(exchange)
+    if matrix_meta is None:
+        raise FileNotFoundError('No price matrix built for: '+str(exchange))
+    thresholds = {'stale_run': stale_run, 'jump_ratio': jump_ratio}
+    meta = _read_quality_meta(exchange)
+    if meta is not None and meta['version'] == matrix_meta['version'] and meta['thresholds'] == thresholds:
+        return
+
+    matrix = PriceMatrix(exchange)
+    n_tickers = len(matrix.tickers)
+    if (meta is not None and meta['tickers'] == matrix_meta['tickers'] and meta['thresholds'] == thresholds
+            and matrix_meta['partitions'][:len(meta['partitions'])] == meta['partitions']):
+        start = meta['n_dates']
+        with np.load(state_path) as saved:
+            state = {key: saved[key] for key in saved.files}
+        mode = 'r+b'
+    else:
+        start = 0
+        state = _new_quality_state(n_tickers)
+        mode = 'wb'
+
+    with open(mask_path+('' if mode == 'r+b' else '.tmp'), mode) as f:
+        if mode == 'r+b':
+            #drop anything left over from an interrupted update before adding the rows
+            f.truncate(start * n_tickers)
+            f.seek(0, os.SEEK_END)
+        for chunk_start in range(start, len(matrix), chunk_rows):
+            block = matrix.values[chunk_start:chunk_start+chunk_rows]
+            f.write(_scan_quality_block(block, state, stale_run, jump_ratio).tobytes())
+    if mode == 'wb':
+        os.replace(mask_path+'.tmp', mask_path)
+
+    np.savez(state_path+'.tmp.npz', **state)
+    os.replace(state_path+'.tmp.npz', state_path)
+    with open(meta_path+'.tmp', 'w') as f:
+        json.dump({'version': matrix_meta['version'], 'n_dates': len(matrix), 'thresholds': thresholds,
+                   'tickers': matrix_meta['tickers'], 'partitions': matrix_meta['partitions']}, f)
+    os.replace(meta_path+'.tmp', meta_path)
+
+class DataQuality:
+    """Data quality flags of an exchange's price matrix, a memory-mapped 
+    uint8 mask of QUALITY_FLAGS bits per (date, ticker) & per ticker counts.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    """
+    def __init__(self, exchange):
+        mask_path, state_path, _ = _quality_paths(exchange)
+        meta = _read_quality_meta(exchange)
+        if meta is None:
+            raise FileNotFoundError('No quality index built for: '+str(exchange))
+        self.version = meta['version']
+        self.thresholds = meta['thresholds']
+        self.tickers = pd.Index(meta['tickers'])
+        with np.load(state_path) as saved:
+            self._state = {key: saved[key] for key in saved.files}
+        self.mask = np.memmap(mask_path, dtype='uint8', mode='r',
+                              shape=(meta['n_dates'], len(meta['tickers'])))
+
+    def summary(self):
+        """Returns the per ticker count of rows with each flag, the number 
+        of closed gaps & the last valid price as a DataFrame"""
+        return _quality_summary(self._state, self.tickers)
+
+    def flagged(self, start, end, flags=list(QUALITY_FLAGS)):
+        """Returns whether each ticker has any of flags in matrix rows start to end-1
+        Parameters
+        ----------
+        start, end : int
+            The matrix rows of the window, see PriceMatrix._rows
+        flags : int or list
+            QUALITY_FLAGS bits or names, all flags by default
+        """
+        bits = _flag_bits(flags)
+        flagged = np.zeros(len(self.tickers), dtype=bool)
+        #a block of rows at a time so long windows don't expand the whole mask
+        for chunk_start in range(start, end, 4096):
+            flagged |= (np.bitwise_or.reduce(self.mask[chunk_start:min(chunk_start+4096, end)], axis=0) & bits) > 0
+        return flagged
+
+def priceDB_validation(database, drop_flags=['negative']):
+    """Takes the prices database & checks it with scan_quality,
+    the stocks with any of drop_flags are dropped.
+    Parameters
+    ----------
+    database : DataFrame
+        The dataframe of stock prices to be checked.
+    drop_flags : list
+        The QUALITY_FLAGS names which drop a stock, default is negative prices
+
+    Returns
+    -------
+    database : DataFrame 
+        The database with the offending stocks removed.
+    """
+    mask, summary = scan_quality(database)
+    print('---------------------------------------------------------------------')
+    for flag in QUALITY_FLAGS:
+        print('Prices flagged '+flag+' are seen in the following assets: '+str((summary[flag] > 0).sum()))
+    drop_cols=summary.index[(summary[drop_flags] > 0).any(axis=1)].tolist()
+    if len(drop_cols) >0:
+        #Drop the offending columns, repulling the data has not fixed these in the past
+        print('The following columns have been dropped: ')
+        print(drop_cols)
+        database.drop(columns=drop_cols, inplace=True)
+    return database
@@ -0,0 +1,334 @@
+#Screening the universe & selecting the top stocks of a window
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from .instrument import current_span, timed, _frame_shape
+from .matrix import PriceMatrix
+from .quality import scan_quality, _flag_bits
+from .estimation import factor_risk_model
+
+#Screening functions
+
+#Applies the price, NA, delisting & returns screens for a date range
+@timed()
+def screen_universe(database,startdate,enddate,p_max=400, min_returns=0.01, silent=True, quality_flags=0):
+    """Subsets the prices to a date range & drops the stocks which are 
+    unaffordable, mostly NA, delisted or have low returns over the range.
+    Parameters
+    ----------
+    database : DataFrame or PriceMatrix
+        The dataframe of stock prices.
+    startdate, enddate : str
+        'YYYY-MM-DD' bounds of the window
+    p_max : float
+        Stocks with a latest price above this are dropped as unaffordable
+    min_returns : float
+        Stocks returning less than this over the window are dropped
+    silent : Boolean
+        False: prints the number of stocks dropped by each screen
+    quality_flags : int or list
+        Stocks with any of these QUALITY_FLAGS (bits or names) in the window are
+        dropped, read from a PriceMatrix's quality index when it has been built.
+        0 is no quality screen
+
+    Returns
+    -------
+    df_input : DataFrame 
+        The prices of the remaining stocks over the window
+    """
+    # A PriceMatrix with an availability index is screened by lookups
+    if isinstance(database, PriceMatrix) and database.availability() is not None:
+        l_screened=_screen_tickers_indexed(database,startdate,enddate,p_max,min_returns,silent,quality_flags)
+        return database.window(startdate,enddate,l_screened)
+
+    # Subset for date range, a PriceMatrix gives a view of the mapped prices
+    if isinstance(database, PriceMatrix):
+        df_input=database.window(startdate,enddate)
+        p_now=database.last_prices()
+    else:
+        df_input=database[startdate:enddate]
+        p_now=database.iloc[-1,:]
+    current_span().set(**_frame_shape(df_input, 'in'))
+    if silent == False:
+        print ("Initial number of stocks: "+str(len(df_input.columns)))
+
+    #Check for stocks which are too expensive for us to buy & drop those
+    df_unaffordable=p_now[p_now>p_max] #we can set max price here maybe as an optional
+    l_unaffordable=df_unaffordable.index.tolist()
+    df_input.drop(columns=l_unaffordable, inplace=True)
+    if silent == False:
+        print ("-----------------------------------------------------")
+        print ("Our max price is : €"+str(p_max))
+        print ("Number of stocks to drop due being unnaffordble: "+str(len(l_unaffordable)))
+        print ("Number of stocks remaining: "+str(len(df_input.columns)))
+
+
+    # drop any columns with more than half or more Nas as the models dont like these
+    half_length=int(len(df_input)*0.50)
+    l_drop=df_input.columns[df_input.iloc[:half_length,:].isna().all()].tolist()
+    df_input.drop(columns=l_drop, inplace=True)
+    if silent == False:
+        print ("-----------------------------------------------------")
+        print ("Number of stocks due to NAs: "+str(len(l_drop)))
+        print ("Number of stocks remaining: "+str(len(df_input.columns)))
+
+    # drop any columns with more  Nas for their last 5 rows as these have been delisted
+    l_drop=df_input.columns[df_input.iloc[-3:,:].isna().all()].tolist()
+    df_input.drop(columns=l_drop, inplace=True)
+    if silent == False:
+        print ("-----------------------------------------------------")
+        print ("Number of stocks due to being delisted: "+str(len(l_drop)))
+        print ("Number of stocks remaining: "+str(len(df_input.columns)))
+
+
+    #see which stocks have negative returns or low returns in the period & drop those
+    df_pct=(df_input.iloc[-1,:].fillna(0) / df_input.iloc[0,:])
+    df_pct=df_pct[df_pct<= (min_returns + 1)] #we can set minimum returns here maybe as an optional
+    l_pct=df_pct.index.tolist()
+    df_input.drop(columns=l_pct, inplace=True)
+    if silent == False:
+        print ("-----------------------------------------------------")
+        print ("Number of stocks due to Negative returns: "+str(len(l_pct)))
+        print ("Number of stocks remaining: "+str(len(df_input.columns)))
+
+    #drop stocks with data quality issues in the window
+    if _flag_bits(quality_flags) != 0:
+        l_flagged=df_input.columns[_window_flagged(database,startdate,enddate,df_input,quality_flags)].tolist()
+        df_input.drop(columns=l_flagged, inplace=True)
+        if silent == False:
+            print ("-----------------------------------------------------")
+            print ("Number of stocks due to data quality: "+str(len(l_flagged)))
+            print ("Number of stocks remaining: "+str(len(df_input.columns)))
+    current_span().set(**_frame_shape(df_input, 'out'))
+    if silent == False:
+        print ("Number of days data: "+str(len(df_input)))
+        print ("As default we will only keep the top 50 performing stocks when creating our portfolio(this can be varied using s_asset & asset_len)")
+
+    return df_input
+
+#The screens of screen_universe answered from a PriceMatrix's availability index
+@timed('screen_indexed')
+def _screen_tickers_indexed(database,startdate,enddate,p_max=400, min_returns=0.01, silent=True, quality_flags=0):
+    """As screen_universe but each screen is a lookup into the availability 
+    index & a vectorised comparison over the tickers, returns the tickers of 
+    the remaining stocks rather than their prices"""
+    index = database.availability()
+    rows = database._rows(startdate,enddate)
+    start, end = rows.start, max(rows.stop, rows.start)
+    keep = np.ones(len(database.tickers), dtype=bool)
+
+    def report(title, dropped):
+        if silent == False:
+            print ("-----------------------------------------------------")
+            if title is not None:
+                print (title)
+            print ("Number of stocks "+dropped[0]+": "+str(dropped[1]))
+            print ("Number of stocks remaining: "+str(keep.sum()))
+
+    if silent == False:
+        print ("Initial number of stocks: "+str(keep.sum()))
+
+    #Check for stocks which are too expensive for us to buy & drop those
+    p_now=np.asarray(database.values[-1]) if len(database) > 0 else np.full(len(keep), np.nan)
+    drop=keep & (p_now>p_max)
+    keep&=~drop
+    report("Our max price is : €"+str(p_max), ("to drop due being unnaffordble", drop.sum()))
+
+    # drop any columns with more than half or more Nas as the models dont like these
+    half_length=int((end-start)*0.50)
+    drop=keep & (index.valid_rows(start,start+half_length)==0)
+    keep&=~drop
+    report(None, ("due to NAs", drop.sum()))
+
+    # drop any columns with more  Nas for their last 5 rows as these have been delisted
+    drop=keep & (index.valid_rows(max(end-3,start),end)==0)
+    keep&=~drop
+    report(None, ("due to being delisted", drop.sum()))
+
+    #see which stocks have negative returns or low returns in the period & drop those
+    if end > start:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct=np.nan_to_num(np.asarray(database.values[end-1]),nan=0.0) / np.asarray(database.values[start])
+        drop=keep & (pct <= (min_returns + 1))
+    else:
+        drop=np.zeros(len(keep), dtype=bool)
+    keep&=~drop
+    report(None, ("due to Negative returns", drop.sum()))
+
+    #drop stocks with data quality issues in the window
+    if _flag_bits(quality_flags) != 0:
+        tickers=database.tickers[keep]
+        drop=np.zeros(len(keep), dtype=bool)
+        drop[np.flatnonzero(keep)]=_window_flagged(database,startdate,enddate,tickers,quality_flags)
+        keep&=~drop
+        report(None, ("due to data quality", drop.sum()))
+    if silent == False:
+        print ("Number of days data: "+str(end-start))
+        print ("As default we will only keep the top 50 performing stocks when creating our portfolio(this can be varied using s_asset & asset_len)")
+
+    current_span().set(rows_in=end-start, columns_in=len(keep), rows_out=end-start, columns_out=int(keep.sum()))
+    return database.tickers[keep]
+
+#Flags of the screened stocks in a window, from the quality index if there is one
+def _window_flagged(database, startdate, enddate, prices, quality_flags):
+    """Returns whether each of the screened stocks (a DataFrame of their window 
+    prices or their tickers) has any of quality_flags in the window"""
+    tickers = prices.columns if isinstance(prices, pd.DataFrame) else pd.Index(prices)
+    if isinstance(database, PriceMatrix) and database.quality() is not None:
+        quality = database.quality()
+        rows = database._rows(startdate, enddate)
+        flagged = quality.flagged(rows.start, max(rows.stop, rows.start), quality_flags)
+        return flagged[quality.tickers.get_indexer(tickers)]
+    #without an index the window is scanned, so moves into its first row aren't seen
+    if not isinstance(prices, pd.DataFrame):
+        prices = database.window(startdate, enddate, tickers)
+    mask, _ = scan_quality(prices)
+    return (np.bitwise_or.reduce(mask.to_numpy(), axis=0) & _flag_bits(quality_flags)) > 0
+
+#Keeps the best performing stocks & estimates their returns & covariance
+@timed()
+def estimate_top_assets(df_input, s_asset=0, asset_len=50, risk_model='SAMPLE', n_factors=10, shrinkage=0.0):
+    """Ranks a screened universe by mean historical return, keeps the 
+    asset_len best performing stocks from rank s_asset & estimates their
+    expected returns & covariance.
+    Parameters
+    ----------
+    df_input : DataFrame
+        The prices of the screened stocks, see screen_universe
+    s_asset, asset_len : int
+        Keeps the asset_len best performing stocks starting from rank s_asset,
+        asset_len None keeps all the stocks from rank s_asset
+    risk_model : str
+        SAMPLE: risk_models.sample_cov
+        FACTOR: factor_risk_model with n_factors factors
+    n_factors : int
+        The number of factors of the FACTOR risk model
+    shrinkage : float
+        Between 0 & 1, the shrinkage of the FACTOR risk model's 
+        idiosyncratic variances towards their average
+
+    Returns
+    -------
+    mu : Series 
+        Expected annualised returns of the top stocks
+    S : DataFrame or FactorRiskModel
+        Annual covariance of the top stocks
+    top_stocks : Index 
+        The tickers of the top stocks
+    """
+    from pypfopt import expected_returns
+    #We will only keep the X best performing assets can make this an optional input
+    e_asset=None if asset_len is None else s_asset + asset_len
+    df=df_input
+    mu = expected_returns.mean_historical_return(df)
+    top_stocks = mu.sort_values(ascending=False).index[s_asset:e_asset]
+    df = df[top_stocks]
+
+    #Calculate expected annulised returns & annual sample covariance matrix of the daily asset
+    mu = expected_returns.mean_historical_return(df)
+    S = _estimate_risk(df, risk_model, n_factors, shrinkage)
+    return mu, S, top_stocks
+
+#Estimates the covariance of the top stocks with the chosen risk model
+@timed('estimate_risk')
+def _estimate_risk(df, risk_model='SAMPLE', n_factors=10, shrinkage=0.0):
+    """Returns the sample covariance (SAMPLE) or factor model (FACTOR) of prices"""
+    current_span().set(risk_model=risk_model, **_frame_shape(df, 'in'))
+    if risk_model == 'FACTOR':
+        return factor_risk_model(df, n_factors, shrinkage)
+    elif risk_model == 'SAMPLE':
+        from pypfopt import risk_models
+        return risk_models.sample_cov(df)
+    raise ValueError('risk_model must be one of SAMPLE, FACTOR')
+
+#Scores the screened stocks of a PriceMatrix a block of columns at a time
+@timed()
+def top_n_tickers(database, startdate, enddate, tickers, s_asset=0, asset_len=50, chunk_size=256, score=None):
+    """Ranks tickers by a score computed a chunk of columns at a time from the 
+    matrix, keeping only a running heap of the best asset_len+s_asset, so peak 
+    memory depends on chunk_size rather than on the number of tickers.
+    Parameters
+    ----------
+    database : PriceMatrix
+        The memory-mapped prices
+    startdate, enddate : str
+        'YYYY-MM-DD' bounds of the window
+    tickers : list
+        The tickers to rank, e.g. those passing the screens
+    s_asset, asset_len : int
+        Keeps the asset_len best scoring stocks starting from rank s_asset,
+        asset_len None keeps all the stocks from rank s_asset
+    chunk_size : int
+        The number of columns scored at a time
+    score : function, optional
+        Maps a DataFrame of prices to a Series of scores by ticker, 
+        expected_returns.mean_historical_return (CAGR) if None
+
+    Returns
+    -------
+    Index 
+        The selected tickers from best to worst score
+    """
+    if score is None:
+        from pypfopt import expected_returns
+        score = expected_returns.mean_historical_return
+    e_asset = len(tickers) if asset_len is None else s_asset + asset_len
+    heap = []
+    unscored = []
+    order = 0
+    for j in range(0, len(tickers), chunk_size):
+        chunk_scores = score(database.window(startdate, enddate, tickers[j:j+chunk_size]))
+        for ticker, value in chunk_scores.items():
+            if np.isnan(value):
+                #NaN scores rank last as they do in sort_values
+                unscored.append(ticker)
+                continue
+            item = (value, -order, ticker)
+            order += 1
+            if len(heap) < e_asset:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    ranked = [ticker for _, _, ticker in sorted(heap, reverse=True)] + unscored
+    current_span().set(columns_in=len(tickers), columns_out=len(ranked[s_asset:e_asset]))
+    return pd.Index(ranked[s_asset:e_asset])
+
+#Screens the universe & estimates mu & S of the best performing stocks
+@timed()
+def screen_and_estimate(database,startdate,enddate,p_max=400, min_returns=0.01, s_asset=0, asset_len=50, silent=True, chunk_size=256, risk_model='SAMPLE', n_factors=10, shrinkage=0.0, quality_flags=0):
+    """Runs screen_universe then estimate_top_assets. For a PriceMatrix with an 
+    availability index the screened stocks are ranked a chunk of columns at a 
+    time by top_n_tickers & only the top stocks' prices are loaded in full.
+    Parameters
+    ----------
+    database : DataFrame or PriceMatrix
+        The dataframe of stock prices.
+    startdate, enddate : str
+        'YYYY-MM-DD' bounds of the window
+    p_max, min_returns, s_asset, asset_len, silent, risk_model, n_factors, shrinkage, quality_flags : 
+        As in portfolio_generate_test
+    chunk_size : int
+        The number of columns ranked at a time for a PriceMatrix
+
+    Returns
+    -------
+    mu : Series 
+        Expected annualised returns of the top stocks
+    S : DataFrame or FactorRiskModel
+        Annual covariance of the top stocks
+    top_stocks : Index 
+        The tickers of the top stocks
+    """
+    if isinstance(database, PriceMatrix) and database.availability() is not None:
+        l_screened=_screen_tickers_indexed(database,startdate,enddate,p_max,min_returns,silent,quality_flags)
+        top_stocks=top_n_tickers(database,startdate,enddate,l_screened,s_asset,asset_len,chunk_size)
+        df=database.window(startdate,enddate,top_stocks)
+        from pypfopt import expected_returns
+        mu = expected_returns.mean_historical_return(df)
+        S = _estimate_risk(df, risk_model, n_factors, shrinkage)
+        return mu, S, top_stocks
+
+    df_input=screen_universe(database,startdate,enddate,p_max,min_returns,silent,quality_flags)
+    return estimate_top_assets(df_input,s_asset,asset_len,risk_model,n_factors,shrinkage)
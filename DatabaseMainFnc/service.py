@@ -0,0 +1,344 @@
+#Local portfolio service, a long running process that keeps an exchange's prices & estimates warm
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .client import SERVICE_HOST, SERVICE_PORT
+from .store import DATE_FORMAT, read_store_manifest
+from .matrix import open_price_matrix, _read_matrix_meta, _read_availability_meta
+from .quality import _read_quality_meta
+from .optimisation import _start_worker, _grid_solve, _solve_frontier_points
+from .backtest import (GRID_PARAMETERS, RESULT_COLUMNS, FRONTIER_COLUMNS, grid_configs, _stage_key,
+                       _grid_screen, _grid_estimate)
+from .evaluation import next_year_prices, evaluate_portfolios
+
+#Requests & responses are single lines of json over a TCP or Unix socket:
+#   {"id": 1, "method": "backtest", "params": {"startdate": "2016-01-01", "enddate": "2018-01-01"}}
+#   {"id": 1, "result": {...}} or {"id": 1, "error": "..."}
+#Requests on one connection are answered as they finish, so a client can pipeline many.
+
+def _indexes_built(exchange, manifest):
+    """Returns True if the price matrix & its availability & quality indexes
+    are all built from the store version of manifest"""
+    metas = [_read_matrix_meta(exchange), _read_availability_meta(exchange), _read_quality_meta(exchange)]
+    return all(meta is not None and meta['version'] == manifest['version'] for meta in metas)
+
+def _to_json(value):
+    """Converts the numpy & pandas values of a result for json.dumps"""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError('Cannot serialise: '+repr(value))
+
+class PortfolioService:
+    """Serves optimisation, frontier & backtest requests for one exchange from
+    a single long running process. The price matrix is opened once & the screens
+    & estimates (mu, S & top stocks) of each window are kept in an in-memory LRU,
+    so a request only waits for its solve. Concurrent requests for the same
+    screen, estimate or solve are merged into one computation. Screens, estimates
+    & evaluations run on a thread pool sharing the mapped prices, solves run on
+    a pool of worker processes which each keep their compiled ParametricFrontiers.
+    The store is polled for update_db appends, the matrix is reopened once 
+    update_db has rebuilt it & its indexes.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    max_workers : int, optional
+        The number of solve worker processes, the number of cores if None
+    max_threads : int
+        The number of threads screening, estimating & evaluating
+    max_artefacts : int
+        The number of screens & estimates kept warm
+    poll_interval : float
+        Seconds between checks of the store for new rows
+    """
+    def __init__(self, exchange, max_workers=None, max_threads=4, max_artefacts=256, poll_interval=5.0):
+        self.exchange = exchange
+        self.max_workers = os.cpu_count() if max_workers is None else max_workers
+        self.max_artefacts = max_artefacts
+        self.poll_interval = poll_interval
+        #only built here if update_db hasn't already, so don't start the service during an update_db
+        manifest = read_store_manifest(exchange)
+        self.matrix = open_price_matrix(exchange, manifest is None or not _indexes_built(exchange, manifest))
+
+        self._artefacts = OrderedDict()
+        self._inflight = {}
+        self._generation = 0
+        self._threads = ThreadPoolExecutor(max_threads)
+        #spawned workers only import the optimisers, the solves & _start_worker live in optimisation
+        self._workers = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_start_worker)
+        self._methods = {'optimise': self.optimise, 'frontier': self.frontier,
+                         'backtest': self.backtest, 'status': self.status}
+
+    #Shared & warm computations
+
+    def _run_thread(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self._threads, fn, *args)
+
+    def _run_worker(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self._workers, fn, *args)
+
+    def _shared(self, key, compute, keep=False):
+        """Returns the future of compute(), a request with the same key as one
+        in flight waits on the same future. With keep the result is added to
+        the warm artefacts unless the prices changed while it was computed"""
+        if key in self._inflight:
+            return self._inflight[key]
+        generation = self._generation
+        future = asyncio.ensure_future(compute())
+        self._inflight[key] = future
+
+        def done(future):
+            self._inflight.pop(key, None)
+            if (keep and generation == self._generation and not future.cancelled()
+                    and future.exception() is None):
+                self._artefacts[key] = future.result()
+                while len(self._artefacts) > self.max_artefacts:
+                    self._artefacts.popitem(last=False)
+        future.add_done_callback(done)
+        return future
+
+    async def _artefact(self, key, compute):
+        """Returns a warm artefact, computing it once if it is missing"""
+        if key in self._artefacts:
+            self._artefacts.move_to_end(key)
+            return self._artefacts[key]
+        #shielded so a cancelled request doesn't cancel the computation others wait on
+        return await asyncio.shield(self._shared(key, compute, keep=True))
+
+    async def _estimate(self, startdate, enddate, config):
+        """Returns mu, S & the top stocks of a window, sharing the screen
+        between estimates as run_grid"""
+        matrix = self.matrix
+        screen_key = ('screen', startdate, enddate) + _stage_key(config, ['screen'])
+        estimate_key = ('estimate', startdate, enddate) + _stage_key(config, ['screen', 'estimate'])
+
+        async def screen():
+            return await self._run_thread(_grid_screen, matrix, startdate, enddate, *screen_key[3:])
+
+        async def estimate():
+            screened = await self._artefact(screen_key, screen)
+            return await self._run_thread(_grid_estimate, matrix, startdate, enddate, screened,
+                                          *estimate_key[len(screen_key):])
+        return await self._artefact(estimate_key, estimate)
+
+    async def _solve(self, startdate, enddate, config):
+        """Solves one config's objective on a worker, returning the _grid_solve row
+        & the top stocks"""
+        mu, S, top_stocks = await self._estimate(startdate, enddate, config)
+        #the target is only used by the RISK & RETURN objectives
+        target_percent = config['target_percent'] if config['obj_method'] in ['RISK', 'RETURN'] else None
+        leaf = (config['obj_method'], target_percent, config['optimiser'])
+        key = ('solve', startdate, enddate) + _stage_key(config, ['screen', 'estimate']) + leaf
+
+        async def solve():
+            return (await self._run_worker(_grid_solve, mu, S, [leaf]))[0]
+        row = await asyncio.shield(self._shared(key, solve))
+        if row[5] is not None:
+            raise ValueError(row[5])
+        return row, top_stocks
+
+    def _config(self, params, stages):
+        """Returns the window & complete config of a request's params"""
+        params = dict(params)
+        try:
+            startdate = pd.to_datetime(params.pop('startdate')).strftime(DATE_FORMAT)
+            enddate = pd.to_datetime(params.pop('enddate')).strftime(DATE_FORMAT)
+        except KeyError as e:
+            raise ValueError('Missing parameter: '+str(e))
+        allowed = [name for name, (stage, _) in GRID_PARAMETERS.items() if stage in stages]
+        unknown = set(params) - set(allowed)
+        if len(unknown) > 0:
+            raise ValueError('Unknown parameters: '+str(sorted(unknown)))
+        return startdate, enddate, grid_configs([params])[0]
+
+    #Request methods
+
+    async def optimise(self, **params):
+        """Optimises the portfolio of a window, params are startdate, enddate &
+        any GRID_PARAMETERS. Returns its expected_returns, volatility, sharpe,
+        weights & objective"""
+        startdate, enddate, config = self._config(params, ['screen', 'estimate', 'solve'])
+        row, _ = await self._solve(startdate, enddate, config)
+        return dict(zip(['expected_returns', 'volatility', 'sharpe', 'weights', 'objective'], row[:5]))
+
+    async def frontier(self, targets, target_type='RISK', **params):
+        """Solves a frontier of a window as efficient_frontier_sweep, params are
+        startdate, enddate & the screen & estimate GRID_PARAMETERS. Returns a
+        list of dicts with the FRONTIER_COLUMNS"""
+        if target_type not in ['RISK', 'RETURN']:
+            raise ValueError('target_type must be one of RISK, RETURN')
+        startdate, enddate, config = self._config(params, ['screen', 'estimate'])
+        targets = [float(target) for target in targets]
+        mu, S, _ = await self._estimate(startdate, enddate, config)
+        key = (('frontier', startdate, enddate) + _stage_key(config, ['screen', 'estimate'])
+               + (target_type, tuple(targets)))
+
+        async def solve():
+            return await self._run_worker(_solve_frontier_points, mu, S, targets, target_type)
+        rows = await asyncio.shield(self._shared(key, solve))
+        return [dict(zip(FRONTIER_COLUMNS, row)) for row in rows]
+
+    async def backtest(self, **params):
+        """Runs portfolio_generate_test on a window, params are startdate, enddate
+        & any GRID_PARAMETERS. Returns a dict with the RESULT_COLUMNS"""
+        startdate, enddate, config = self._config(params, ['screen', 'estimate', 'solve'])
+        row, top_stocks = await self._solve(startdate, enddate, config)
+        matrix = self.matrix
+
+        def evaluate():
+            df_actual = next_year_prices(matrix, enddate, top_stocks)
+            return evaluate_portfolios(df_actual, pd.DataFrame([row[3]])).iloc[0]
+        df_perf = await self._run_thread(evaluate)
+        return dict(zip(RESULT_COLUMNS, [startdate, enddate] + row[:3]
+                        + [df_perf[column] for column in ['max_returns', 'min_returns', 'actual_returns', 'mean_returns']]
+                        + [row[4]]))
+
+    async def status(self):
+        """Returns the version & extent of the served prices & the number of
+        warm artefacts & requests in flight"""
+        return {'exchange': self.exchange, 'version': self.matrix.version,
+                'n_dates': len(self.matrix), 'n_tickers': len(self.matrix.tickers),
+                'last_date': self.matrix.dates[-1].strftime(DATE_FORMAT) if len(self.matrix) > 0 else None,
+                'artefacts': len(self._artefacts), 'inflight': len(self._inflight),
+                'generation': self._generation}
+
+    #Store updates
+
+    async def refresh(self):
+        """Picks up new rows of the store once update_db has rebuilt the matrix &
+        its indexes, the service never builds them itself so it can't write them
+        while update_db does. Every screen & estimate is dropped, as the p_max 
+        screen of any window is taken from the latest prices. Returns True if 
+        the prices changed"""
+        manifest = read_store_manifest(self.exchange)
+        if manifest is None or manifest['version'] == self.matrix.version or not _indexes_built(self.exchange, manifest):
+            return False
+        self.matrix = await self._run_thread(open_price_matrix, self.exchange, False)
+        self._generation += 1
+        self._artefacts.clear()
+        print('Serving '+str(self.exchange)+' prices up to '+str(self.matrix.dates[-1].date())
+              +', version: '+str(self.matrix.version))
+        return True
+
+    async def _watch_store(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print('Store refresh failed: '+repr(e))
+
+    #Connections
+
+    async def _respond(self, line, writer, lock):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            if request.get('method') not in self._methods:
+                raise ValueError('Unknown method: '+str(request.get('method')))
+            response = {'id': request_id, 'result': await self._methods[request['method']](**request.get('params', {}))}
+        except Exception as e:
+            response = {'id': request_id, 'error': repr(e)}
+        async with lock:
+            writer.write(json.dumps(response, default=_to_json).encode()+b'\n')
+            await writer.drain()
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if len(tasks) > 0:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            #the service is stopping, the connection is simply closed
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=SERVICE_HOST, port=SERVICE_PORT, path=None):
+        """Starts listening on host:port, or on the Unix socket at path, & watching
+        the store. Returns the asyncio server"""
+        if path is None:
+            server = await asyncio.start_server(self._handle, host, port, limit=2**24)
+        else:
+            server = await asyncio.start_unix_server(self._handle, path, limit=2**24)
+        self._watcher = asyncio.ensure_future(self._watch_store())
+        #start the solve workers now rather than on the first request
+        await asyncio.gather(*[self._run_worker(_start_worker) for _ in range(self.max_workers)])
+        print('Serving '+str(self.exchange)+' on '+(str(host)+':'+str(port) if path is None else str(path)))
+        return server
+
+    def close(self):
+        """Stops watching the store & shuts down the thread & worker pools"""
+        if getattr(self, '_watcher', None) is not None:
+            self._watcher.cancel()
+        self._threads.shutdown(wait=False)
+        #wait for the workers to exit so none outlive the service
+        self._workers.shutdown(wait=True, cancel_futures=True)
+
+def serve(exchange, host=SERVICE_HOST, port=SERVICE_PORT, path=None, **kwargs):
+    """Runs a PortfolioService for an exchange until interrupted.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    host, port : str, int
+        The local address to listen on
+    path : str, optional
+        Listens on a Unix socket at path instead of host:port
+    **kwargs :
+        Passed to PortfolioService
+    """
+    async def main():
+        service = PortfolioService(exchange, **kwargs)
+        #the workers are shut down even if the service fails to start
+        try:
+            server = await service.start(host, port, path)
+            try:
+                #a terminate stops the service like an interrupt, not available on Windows
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+            except (AttributeError, NotImplementedError):
+                pass
+            async with server:
+                await server.serve_forever()
+        finally:
+            service.close()
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serves portfolio requests for an exchange from a warm local process')
+    parser.add_argument('exchange')
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--path', default=None, help='listen on a Unix socket at this path')
+    parser.add_argument('--workers', type=int, default=None, help='solve worker processes')
+    parser.add_argument('--poll', type=float, default=5.0, help='seconds between store checks')
+    args = parser.parse_args()
+    serve(args.exchange, args.host, args.port, args.path, max_workers=args.workers, poll_interval=args.poll)
@@ -0,0 +1,300 @@
+#Price database maintainance & the partitioned parquet price store
+import os
+import json
+import datetime
+
+import pandas as pd
+
+from .instrument import span, current_span, timed, _frame_shape
+
+DATE_FORMAT = '%Y-%m-%d'
+PRICE_DB_DIR = 'Price Databases'
+
+# Database maintainance functions
+
+#Connects to the price store, migrating the old CSV database on first use
+def connectAndLoadDb(exchange):
+    """Connects to and loads the data for an exchange.
+    If no price store exists yet for the exchange but the old CSV database
+    "Price Databases\database_"+str(exchange)+".csv" does, it is migrated
+    to the price store first (this only happens once).
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        "Price Databases\store_"+str(exchange)
+
+    Returns
+    -------
+    DataFrame 
+        database with dates & assets prices 
+        in the native currency in each column
+    """
+
+    print("Connecting database:"+str(exchange))
+    if read_store_manifest(exchange) is None:
+        migrate_csv_to_store(exchange)
+    database = load_store(exchange)
+    database.index = database.index.strftime(DATE_FORMAT)
+    database.index.name = 'Date'
+    database.reset_index(inplace=True)
+    print("Database connected!")
+    return database
+
+#Gets the latest date of data in the db
+def getLastEntryDate(database):
+    """Gets the most recent entry date from 
+    the prices database
+    Parameters
+    ----------
+    database : DataFrame
+        The database of prices with a date column or index 'Date'
+
+    Returns
+    -------
+    str
+        The most recent entry date in '%Y-%m-%d' format
+    """
+    lastDateEntry = database.iloc[-1]['Date']
+    lastDateEntry = datetime.datetime.strptime(lastDateEntry, DATE_FORMAT)    
+    return lastDateEntry
+
+#Writes the updated pandas dataframe to the price store
+def writeDbToExcelFile(database,exchange):
+    """Saves the full database to the price store at 
+    'Price Databases\store_'+str(exchange), replacing any 
+    existing history. Use append_to_store to add new rows only.
+    ----------
+    database : DataFrame
+        The database of prices with a date column or index 'Date'
+    exchange : str
+        The name of the index to use in the store name 
+    """
+    print('Writing database to store: '+ _store_path(exchange))
+    write_store(database, exchange)
+    print('Database updated with new entries!!')
+
+#Formats the date from number for printing      
+def prettyPrintDate(date):
+    """Formats a date string to '%Y-%m-%d' format, 
+    used to consistantly print the same date format
+    ----------
+    date : str
+        The date we want to format
+    """
+    return date.strftime(DATE_FORMAT)
+
+#Price store functions
+
+#Each exchange is kept as a folder of parquet partitions plus a json manifest.
+#New rows are written as new partitions so history is never rewritten on update.
+def _store_path(exchange):
+    """Returns the folder holding the price store for an exchange"""
+    return os.path.join(PRICE_DB_DIR, 'store_'+str(exchange))
+
+def _manifest_path(exchange):
+    """Returns the path of the manifest file of an exchange's price store"""
+    return os.path.join(_store_path(exchange), 'manifest.json')
+
+def _to_date_index(database):
+    """Returns a copy of a price frame indexed by a sorted DatetimeIndex 'Date',
+    accepting either a 'Date' column or a date-like index"""
+    df = database.copy()
+    if 'Date' in df.columns:
+        df = df.set_index('Date')
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.index), name='Date')
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    df.columns = [str(col) for col in df.columns]
+    return df
+
+def read_store_manifest(exchange):
+    """Reads the manifest of an exchange's price store.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+
+    Returns
+    -------
+    manifest : dict or None
+        The manifest with the 'version', 'last_date' & 'partitions'
+        of the store, None if there is no store for the exchange.
+    """
+    filename = _manifest_path(exchange)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return json.load(f)
+
+def _write_store_manifest(manifest, exchange):
+    """Atomically replaces the manifest of an exchange's price store"""
+    filename = _manifest_path(exchange)
+    with open(filename+'.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(filename+'.tmp', filename)
+
+def _write_partition(df, exchange, manifest):
+    """Writes a block of rows as a new parquet partition & registers it in the manifest"""
+    seq = manifest['next_partition']
+    part_name = 'part_'+str(seq).zfill(6)+'.parquet'
+    with span('write_partition', exchange=str(exchange), **_frame_shape(df, 'in')) as sp:
+        df.astype('float64').to_parquet(os.path.join(_store_path(exchange), part_name))
+        if sp.enabled:
+            sp.set(bytes_written=os.path.getsize(os.path.join(_store_path(exchange), part_name)))
+    manifest['partitions'].append({'file': part_name,
+                                   'start': prettyPrintDate(df.index[0]),
+                                   'end': prettyPrintDate(df.index[-1]),
+                                   'rows': len(df)})
+    manifest['next_partition'] = seq + 1
+
+@timed()
+def write_store(database, exchange, partition_by='year'):
+    """Writes the full price database to the store for an exchange, 
+    replacing any existing partitions. 
+    Parameters
+    ----------
+    database : DataFrame
+        The database of prices with a date column or index 'Date'
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    partition_by : str
+        'year' writes one partition per calendar year,
+        None writes a single partition.
+    """
+    df = _to_date_index(database)
+    os.makedirs(_store_path(exchange), exist_ok=True)
+
+    old_manifest = read_store_manifest(exchange)
+    manifest = {'version': 1 if old_manifest is None else old_manifest['version'] + 1,
+                'last_date': None,
+                'next_partition': 0 if old_manifest is None else old_manifest['next_partition'],
+                'partitions': []}
+
+    if len(df) > 0:
+        if partition_by == 'year':
+            for _, df_year in df.groupby(df.index.year):
+                _write_partition(df_year, exchange, manifest)
+        else:
+            _write_partition(df, exchange, manifest)
+        manifest['last_date'] = prettyPrintDate(df.index[-1])
+    _write_store_manifest(manifest, exchange)
+
+    #only remove the old partitions once the new manifest is in place
+    if old_manifest is not None:
+        for part in old_manifest['partitions']:
+            os.remove(os.path.join(_store_path(exchange), part['file']))
+
+@timed()
+def append_to_store(new_rows, exchange):
+    """Appends new rows to an exchange's price store as a new partition,
+    only rows dated after the last entry in the store are kept so 
+    existing history is never rewritten.
+    Parameters
+    ----------
+    new_rows : DataFrame
+        The new prices with a date column or index 'Date'
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+
+    Returns
+    -------
+    int 
+        The number of rows appended
+    """
+    manifest = read_store_manifest(exchange)
+    if manifest is None:
+        write_store(new_rows, exchange)
+        return len(new_rows)
+
+    df = _to_date_index(new_rows)
+    if manifest['last_date'] is not None:
+        df = df[df.index > pd.to_datetime(manifest['last_date'])]
+    if len(df) == 0:
+        return 0
+
+    _write_partition(df, exchange, manifest)
+    manifest['last_date'] = prettyPrintDate(df.index[-1])
+    manifest['version'] += 1
+    _write_store_manifest(manifest, exchange)
+    current_span().set(rows_appended=len(df))
+    return len(df)
+
+@timed()
+def load_store(exchange, startdate=None, enddate=None, columns=None):
+    """Loads prices from an exchange's price store, only partitions
+    overlapping the requested date range are read.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    startdate, enddate : str, optional
+        'YYYY-MM-DD' bounds (inclusive) of the rows to load
+    columns : list, optional
+        The tickers to load, all tickers if None
+
+    Returns
+    -------
+    DataFrame 
+        prices indexed by 'Date' with a column per ticker
+    """
+    import pyarrow.parquet as pq
+
+    manifest = read_store_manifest(exchange)
+    if manifest is None:
+        raise FileNotFoundError('No price store found at: '+_store_path(exchange))
+
+    frames = []
+    bytes_read = 0
+    for part in manifest['partitions']:
+        if startdate is not None and part['end'] < str(startdate):
+            continue
+        if enddate is not None and part['start'] > str(enddate):
+            continue
+        filename = os.path.join(_store_path(exchange), part['file'])
+        part_columns = None
+        if columns is not None:
+            #partitions written on different days may not share the same tickers
+            available = set(pq.read_schema(filename).names)
+            part_columns = [col for col in columns if col in available]
+        frames.append(pd.read_parquet(filename, columns=part_columns))
+        bytes_read += os.path.getsize(filename)
+
+    if len(frames) == 0:
+        database = pd.DataFrame(index=pd.DatetimeIndex([], name='Date'))
+    else:
+        database = pd.concat(frames, axis=0, sort=False)
+    if columns is not None:
+        database = database.reindex(columns=columns)
+    database = database.loc[startdate:enddate]
+    current_span().set(exchange=str(exchange), partitions_read=len(frames), bytes_read=bytes_read, 
+                       **_frame_shape(database, 'out'))
+    return database
+
+def migrate_csv_to_store(exchange):
+    """One time migration of the old CSV database at 
+    'Price Databases\database_'+str(exchange)+'.csv' into the price store.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange to migrate
+    """
+    filename = os.path.join(PRICE_DB_DIR, 'database_'+str(exchange)+'.csv')
+    print('Migrating '+filename+' to store: '+_store_path(exchange))
+    database = pd.read_csv(filename, index_col=False)
+    write_store(database, exchange)
+    print('Migration complete!')
+
+def compact_store(exchange):
+    """Merges the many small partitions left by daily updates 
+    back into one partition per year.
+    Parameters
+    ----------
+    exchange : str
+        The name of the exchange stored at
+        'Price Databases\store_'+str(exchange)
+    """
+    write_store(load_store(exchange), exchange)
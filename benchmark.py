@@ -0,0 +1,312 @@
+#Benchmark suite for the hot paths of DatabaseMainFnc
+#Runs fully offline in a temporary folder against synthetic prices & FX rates
+#served by SyntheticProvider & SyntheticFxProvider in place of yfinance & the ECB.
+#
+#   python benchmark.py --tickers 500 --days 1500 --out benchmark_results.json
+#   python benchmark.py --compare old_results.json new_results.json
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import DatabaseMainFnc as dmf
+from DatabaseMainFnc.store import _store_path
+from DatabaseMainFnc.screening import _screen_tickers_indexed
+
+try:
+    import resource
+except ImportError:
+    #not available on Windows, only the traced peaks are recorded there
+    resource = None
+
+BENCH_EXCHANGE = 'BENCH'
+
+#Synthetic data functions
+
+def synthetic_prices(n_tickers=500, n_days=1500, nan_rate=0.001, listing_rate=0.1, delist_rate=0.05,
+                     missing_rate=0.01, end_date=None, seed=0):
+    """Generates a deterministic synthetic price database, the prices are those
+    served by SyntheticProvider so later updates through it line up.
+    Parameters
+    ----------
+    n_tickers : int
+        The number of tickers, named T0, T1, ...
+    n_days : int
+        The number of business days ending at end_date
+    nan_rate : float
+        The chance of each price being missing
+    listing_rate : float
+        The share of tickers listed part way through, NaN before listing
+    delist_rate : float
+        The share of tickers delisted part way through, NaN after delisting
+    missing_rate : float
+        The share of tickers with no prices at all
+    end_date : str, optional
+        'YYYY-MM-DD' last date of the prices, today if None
+    seed : int
+        Seed of the prices & NaN patterns
+
+    Returns
+    -------
+    prices : DataFrame
+        Prices indexed by 'Date' with a column per ticker
+    delisted : list
+        The tickers delisted or missing, to pass to SyntheticProvider
+    """
+    if end_date is None:
+        end_date = datetime.datetime.today()
+    dates = pd.bdate_range(end=end_date, periods=n_days, name='Date')
+    tickers = ['T'+str(i) for i in range(n_tickers)]
+    prices = dmf.SyntheticProvider(seed=seed).download(tickers, dates[0]).loc[:dates[-1]]
+
+    rng = np.random.default_rng(seed)
+    values = prices.to_numpy()
+    values[rng.random(values.shape) < nan_rate] = np.nan
+    rows = np.arange(len(values))[:, None]
+    listed = np.where(rng.random(n_tickers) < listing_rate, rng.integers(0, n_days, n_tickers), 0)
+    delisted = np.where(rng.random(n_tickers) < delist_rate, rng.integers(0, n_days, n_tickers), n_days)
+    missing = rng.random(n_tickers) < missing_rate
+    values[(rows < listed) | (rows >= delisted) | missing] = np.nan
+
+    prices = pd.DataFrame(values, index=prices.index, columns=tickers)
+    return prices, [ticker for ticker, d, m in zip(tickers, delisted, missing) if d < n_days or m]
+
+def setup_workspace(prices, exchange=BENCH_EXCHANGE, currencies=['USD','JPY','GBP'], seed=0):
+    """Lays out the company list, price store & FX store of the synthetic
+    prices in the current folder, as update_db & update_fx_store would"""
+    os.makedirs('Company lists', exist_ok=True)
+    os.makedirs(dmf.PRICE_DB_DIR, exist_ok=True)
+    pd.DataFrame({'Symbol': prices.columns}).to_csv('Company lists/companylist_'+str(exchange)+'.tsv',
+                                                    sep='\t', index=False)
+    dmf.write_store(prices, exchange)
+    dmf.update_fx_store(currencies, dmf.prettyPrintDate(prices.index[0]), dmf.SyntheticFxProvider(seed))
+
+#Timing functions
+
+def _max_rss_bytes():
+    """Returns the peak resident memory of the process so far, None if unknown"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #macOS reports bytes, linux kilobytes
+    return rss if platform.system() == 'Darwin' else rss * 1024
+
+def time_stage(name, fn, setup=None, repeat=3):
+    """Times repeat untraced runs of fn, then measures the peak memory allocated
+    during one more run with tracemalloc. setup is called untimed before each run.
+    Parameters
+    ----------
+    name : str
+        The name of the stage in the results
+    fn : function
+        The stage, called with no arguments
+    setup : function, optional
+        Called before each run of fn, e.g. to restore the files fn changes
+    repeat : int
+        The number of timed runs
+
+    Returns
+    -------
+    dict
+        The stage's 'min_s', 'median_s', 'peak_traced_bytes' & 'max_rss_bytes'
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    result = {'stage': name, 'repeat': repeat, 'min_s': min(times), 'median_s': float(np.median(times)),
+              'peak_traced_bytes': peak, 'max_rss_bytes': _max_rss_bytes()}
+    print(name.ljust(28)+'min '+f'{result["min_s"]*1000:10.2f}'+' ms   peak '+f'{peak/1024**2:9.1f}'+' MB')
+    return result
+
+#Benchmark functions
+
+def run_benchmarks(n_tickers=500, n_days=1500, nan_rate=0.001, listing_rate=0.1, delist_rate=0.05,
+                   missing_rate=0.01, update_days=5, repeat=3, seed=0, out='benchmark_results.json'):
+    """Runs every benchmark stage on a synthetic exchange in a temporary folder
+    & writes the results to a json file.
+    Parameters
+    ----------
+    n_tickers, n_days, nan_rate, listing_rate, delist_rate, missing_rate, seed :
+        The synthetic prices, see synthetic_prices
+    update_days : int
+        The number of business days fetched by each update_db run
+    repeat : int
+        The number of timed runs of each stage
+    out : str
+        The json file the results are written to, None to not write them
+
+    Returns
+    -------
+    dict
+        The 'meta' data of the run & the 'results' of each stage
+    """
+    out = None if out is None else os.path.abspath(out)
+    end_date = pd.bdate_range(end=datetime.datetime.today(), periods=update_days+1)[0]
+    prices, delisted = synthetic_prices(n_tickers, n_days, nan_rate, listing_rate, delist_rate,
+                                        missing_rate, end_date, seed)
+    provider = dmf.SyntheticProvider(missing=delisted, seed=seed)
+
+    #the window leaves a year after it for the evaluation
+    startdate = dmf.prettyPrintDate(prices.index[0])
+    enddate = dmf.prettyPrintDate(prices.index[-1] - pd.DateOffset(years=1, days=7))
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='ef_benchmark_')
+    results = []
+    try:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            setup_workspace(prices, seed=seed)
+        store = _store_path(BENCH_EXCHANGE)
+        shutil.copytree(store, store+'_base')
+
+        def restore_store():
+            shutil.rmtree(store)
+            shutil.copytree(store+'_base', store)
+
+        def restore_and_open():
+            restore_store()
+            dmf.open_price_matrix(BENCH_EXCHANGE)
+
+        #update & load stages
+        results.append(time_stage('write_store', lambda: dmf.writeDbToExcelFile(prices, BENCH_EXCHANGE),
+                                  restore_store, repeat))
+        results.append(time_stage('update_db', lambda: dmf.update_db(BENCH_EXCHANGE, provider=provider),
+                                  restore_store, repeat))
+        results.append(time_stage('update_db_with_indexes', lambda: dmf.update_db(BENCH_EXCHANGE, provider=provider),
+                                  restore_and_open, repeat))
+        results.append(time_stage('connectAndLoadDb', lambda: dmf.connectAndLoadDb(BENCH_EXCHANGE),
+                                  None, repeat))
+        restore_store()
+        results.append(time_stage('open_price_matrix', lambda: dmf.open_price_matrix(BENCH_EXCHANGE),
+                                  lambda: [os.remove(os.path.join(store, f)) for f in os.listdir(store)
+                                           if not f.startswith('part_') and f != 'manifest.json'], repeat))
+
+        #screening, estimation, optimisation & evaluation stages
+        database = dmf.load_store(BENCH_EXCHANGE)
+        matrix = dmf.open_price_matrix(BENCH_EXCHANGE)
+        results.append(time_stage('screen_universe',
+                                  lambda: dmf.screen_universe(database, startdate, enddate), None, repeat))
+        results.append(time_stage('screen_universe_indexed',
+                                  lambda: _screen_tickers_indexed(matrix, startdate, enddate), None, repeat))
+        screened = _screen_tickers_indexed(matrix, startdate, enddate)
+        results.append(time_stage('top_n_tickers',
+                                  lambda: dmf.top_n_tickers(matrix, startdate, enddate, screened), None, repeat))
+        results.append(time_stage('screen_and_estimate',
+                                  lambda: dmf.screen_and_estimate(matrix, startdate, enddate), None, repeat))
+        mu, S, top_stocks = dmf.screen_and_estimate(matrix, startdate, enddate)
+        results.append(time_stage('optimise_pypfopt',
+                                  lambda: dmf.optimise_portfolio(mu, S, 'SHARPE', optimiser='PYPFOPT'), None, repeat))
+        #the first parametric solve compiles the problem, time the warm solves
+        ef, _ = dmf.optimise_portfolio(mu, S, 'SHARPE', optimiser='PARAMETRIC')
+        results.append(time_stage('optimise_parametric',
+                                  lambda: dmf.optimise_portfolio(mu, S, 'SHARPE', optimiser='PARAMETRIC'), None, repeat))
+        weights = pd.DataFrame([ef.clean_weights()])
+        results.append(time_stage('next_year_evaluation',
+                                  lambda: dmf.evaluate_portfolios(dmf.next_year_prices(matrix, enddate, top_stocks), weights),
+                                  None, repeat))
+        results.append(time_stage('portfolio_generate_test',
+                                  lambda: dmf.portfolio_generate_test(matrix, startdate, enddate), None, repeat))
+
+        #FX & tax stages
+        fx_store = _store_path(dmf.FX_STORE)
+        shutil.copytree(fx_store, fx_store+'_base')
+
+        def restore_fx():
+            shutil.rmtree(fx_store)
+            shutil.copytree(fx_store+'_base', fx_store)
+            #drop the newest rates so each run has some days to fetch
+            dmf.write_store(dmf.load_fx_rates().iloc[:-update_days], dmf.FX_STORE)
+
+        results.append(time_stage('update_fx_store',
+                                  lambda: dmf.update_fx_store(provider=dmf.SyntheticFxProvider(seed)), restore_fx, repeat))
+        with contextlib.redirect_stdout(io.StringIO()):
+            dmf.update_fx_store(provider=dmf.SyntheticFxProvider(seed))
+        results.append(time_stage('load_curr_csv', lambda: dmf.load_curr_csv(database, 'USD'), None, repeat))
+        results.append(time_stage('net_gains_x1000',
+                                  lambda: [dmf.net_gains(10000, 0.07, 30) for _ in range(1000)], None, repeat))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'meta': {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                       'python': platform.python_version(), 'platform': platform.platform(),
+                       'numpy': np.__version__, 'pandas': pd.__version__,
+                       'params': {'n_tickers': n_tickers, 'n_days': n_days, 'nan_rate': nan_rate,
+                                  'listing_rate': listing_rate, 'delist_rate': delist_rate,
+                                  'missing_rate': missing_rate, 'update_days': update_days,
+                                  'repeat': repeat, 'seed': seed,
+                                  'startdate': startdate, 'enddate': enddate}},
+              'results': results}
+    if out is not None:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=1)
+        print('Benchmark results written to: '+out)
+    return report
+
+def compare_benchmarks(old_file, new_file):
+    """Compares the min times & traced peaks of the stages of two benchmark result files.
+    Parameters
+    ----------
+    old_file, new_file : str
+        json files written by run_benchmarks
+
+    Returns
+    -------
+    DataFrame
+        One row per stage with the old & new values & new/old ratios
+    """
+    frames = []
+    for filename in [old_file, new_file]:
+        with open(filename) as f:
+            frames.append(pd.DataFrame(json.load(f)['results']).set_index('stage')[['min_s', 'peak_traced_bytes']])
+    df = frames[0].join(frames[1], lsuffix='_old', rsuffix='_new', how='outer')
+    df['time_ratio'] = df['min_s_new'] / df['min_s_old']
+    df['memory_ratio'] = df['peak_traced_bytes_new'] / df['peak_traced_bytes_old']
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline synthetic benchmarks of DatabaseMainFnc')
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--days', type=int, default=1500)
+    parser.add_argument('--nan-rate', type=float, default=0.001)
+    parser.add_argument('--listing-rate', type=float, default=0.1)
+    parser.add_argument('--delist-rate', type=float, default=0.05)
+    parser.add_argument('--missing-rate', type=float, default=0.01)
+    parser.add_argument('--update-days', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files rather than running the benchmarks')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        print(compare_benchmarks(*args.compare).to_string())
+    else:
+        run_benchmarks(args.tickers, args.days, args.nan_rate, args.listing_rate, args.delist_rate,
+                       args.missing_rate, args.update_days, args.repeat, args.seed, args.out)
@@ -0,0 +1,24 @@
+#Shared fixtures, every test runs in its own working directory as the stores & lists are relative paths
+import numpy as np
+import pandas as pd
+import pytest
+
+import DatabaseMainFnc as dmf
+
+def synthetic_prices(n_dates=700, n_tickers=12, seed=0, start='2015-01-01'):
+    """Random walk prices with leading, scattered & block NaN gaps"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_dates, name='Date')
+    prices = 10 * np.exp(np.cumsum(rng.normal(0.0005, 0.015, (n_dates, n_tickers)), axis=0))
+    prices[:120, 0] = np.nan
+    prices[300:340, 1] = np.nan
+    prices[rng.integers(0, n_dates, 150), rng.integers(0, n_tickers, 150)] = np.nan
+    return pd.DataFrame(prices, index=dates, columns=['T'+str(i) for i in range(n_tickers)])
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """An empty working directory with the price database & company list folders"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / dmf.PRICE_DB_DIR).mkdir()
+    (tmp_path / 'Company lists').mkdir()
+    return tmp_path
@@ -0,0 +1,53 @@
+#The grid & single window backtests must agree on every config they share
+import os
+
+import numpy as np
+import pandas as pd
+
+import DatabaseMainFnc as dmf
+from conftest import synthetic_prices
+
+WINDOW = ('2015-01-01', '2016-01-01')
+
+def test_run_grid_matches_portfolio_generate_test():
+    prices = synthetic_prices(n_dates=700, n_tickers=20, seed=7)
+    grid = {'risk_model': ['SAMPLE', 'FACTOR'], 'n_factors': [3], 'shrinkage': [0.0, 0.5],
+            'obj_method': ['SHARPE', 'MIN_VOL'], 'asset_len': [10]}
+    table = dmf.run_grid(prices, *WINDOW, grid, n_jobs=1)
+    assert table['error'].isna().all()
+    for row, config in zip(table.itertuples(), dmf.grid_configs(grid)):
+        expected = dmf.portfolio_generate_test(prices, *WINDOW, **config)
+        np.testing.assert_allclose([row.expected_returns, row.volatility, row.sharpe, row.actual_returns],
+                                   [expected[i] for i in [2, 3, 4, 7]], rtol=1e-5)
+
+    #shrinking the idiosyncratic variances changes the FACTOR portfolios only
+    volatility = table.set_index(['config_risk_model', 'config_shrinkage', 'config_obj_method'])['volatility']
+    assert volatility['SAMPLE', 0.0, 'MIN_VOL'] == volatility['SAMPLE', 0.5, 'MIN_VOL']
+    assert volatility['FACTOR', 0.0, 'MIN_VOL'] != volatility['FACTOR', 0.5, 'MIN_VOL']
+
+def test_shrinkage_reaches_factor_model():
+    prices = synthetic_prices(n_dates=700, n_tickers=20, seed=7)
+    mu, S, top_stocks = dmf.screen_and_estimate(prices, *WINDOW, asset_len=10, risk_model='FACTOR', 
+                                                n_factors=3, shrinkage=0.5)
+    expected = dmf.factor_risk_model(prices.loc[WINDOW[0]:WINDOW[1], top_stocks], 3, 0.5)
+    pd.testing.assert_series_equal(S.idiosyncratic, expected.idiosyncratic)
+
+def test_run_grid_cache(workspace):
+    prices = synthetic_prices(n_dates=700, n_tickers=20, seed=7)
+    cache = dmf.ResultCache(str(workspace / 'cache'))
+    #the infeasible RETURN target fails & is not cached
+    grid = [{'obj_method': 'SHARPE'}, {'obj_method': 'MIN_VOL', 'asset_len': 10}, 
+            {'obj_method': 'RETURN', 'target_percent': 10.0}]
+    first = dmf.run_grid(prices, *WINDOW, grid, n_jobs=1, cache=cache)
+    assert first['error'].isna().tolist() == [True, True, False]
+
+    sink = dmf.MemorySink()
+    with dmf.metrics_sink(sink):
+        second = dmf.run_grid(prices, *WINDOW, grid, n_jobs=1, cache=cache)
+    assert sink.to_frame().set_index('span').loc['run_grid', 'cache_hits'] == 2
+    pd.testing.assert_frame_equal(second, first)
+
+    #the grid & portfolio_generate_test share their cached results
+    cached = dmf.portfolio_generate_test(prices, *WINDOW, asset_len=10, obj_method='MIN_VOL', cache=cache)
+    assert cached[2:] == first.iloc[1][dmf.RESULT_COLUMNS[2:]].tolist()
+    assert len(os.listdir(workspace / 'cache')) == 2
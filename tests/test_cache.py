@@ -0,0 +1,51 @@
+#Cached results must be invalidated by any change to the prices a run reads
+import numpy as np
+import pytest
+
+import DatabaseMainFnc as dmf
+from conftest import synthetic_prices
+
+WINDOW = ('2015-01-01', '2016-01-01')
+
+@pytest.fixture
+def prices():
+    prices = synthetic_prices(n_dates=800, n_tickers=20, seed=8)
+    #the last days' prices push some stocks over p_max, changing the window's screen
+    prices.iloc[-5:] *= 3
+    return prices
+
+def _run(database, p_max, cache=None):
+    return dmf.portfolio_generate_test(database, *WINDOW, p_max=p_max, asset_len=10, cache=cache)[2:9]
+
+def test_cache_invalidated_by_store_updates(workspace, prices):
+    p_max = float(prices.iloc[-1].median())
+    cache = dmf.ResultCache(str(workspace / 'cache'))
+    dmf.write_store(prices.iloc[:-5], 'X')
+    old = dmf.open_price_matrix('X')
+    before = _run(old, p_max, cache)
+    key = cache.key('portfolio_generate_test', old, *WINDOW, {})
+    assert _run(old, p_max, cache) == before
+
+    dmf.append_to_store(prices.iloc[-5:], 'X')
+    new = dmf.open_price_matrix('X')
+    #a matrix opened before the update still reads, & is keyed by, the old prices
+    assert cache.key('portfolio_generate_test', old, *WINDOW, {}) == key
+    assert cache.key('portfolio_generate_test', new, *WINDOW, {}) != key
+    assert _run(old, p_max, cache) == before
+    after = _run(new, p_max, cache)
+    np.testing.assert_allclose(after, _run(new, p_max))
+    assert not np.allclose(after, before)
+
+    #a rewrite of the store is a new version, even of the same prices
+    dmf.compact_store('X')
+    assert cache.key('portfolio_generate_test', dmf.open_price_matrix('X'), *WINDOW, {}) not in [
+        key, cache.key('portfolio_generate_test', new, *WINDOW, {})]
+
+def test_cache_invalidated_by_dataframe_updates(workspace, prices):
+    p_max = float(prices.iloc[-1].median())
+    cache = dmf.ResultCache(str(workspace / 'cache'))
+    before = _run(prices.iloc[:-5], p_max, cache)
+    after = _run(prices, p_max, cache)
+    np.testing.assert_allclose(before, _run(prices.iloc[:-5], p_max))
+    np.testing.assert_allclose(after, _run(prices, p_max))
+    assert not np.allclose(after, before)
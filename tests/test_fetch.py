@@ -0,0 +1,98 @@
+#The fetch pipeline's retries, checkpoints & failed symbol ledger, run offline on SyntheticProvider
+import os
+import datetime
+
+import pandas as pd
+import pytest
+
+import DatabaseMainFnc as dmf
+
+TICKERS = ['T'+str(i) for i in range(12)]
+START = (datetime.date.today() - datetime.timedelta(days=90)).strftime('%Y-%m-%d')
+
+class CountingProvider(dmf.SyntheticProvider):
+    """SyntheticProvider recording the batches it is asked for"""
+    def __init__(self, fail_tickers=(), **kwargs):
+        super().__init__(**kwargs)
+        self.fail_tickers = set(fail_tickers)
+        self.batches = []
+
+    def download(self, tickers, start_date):
+        self.batches.append(list(tickers))
+        if self.fail_tickers & set(tickers):
+            raise ConnectionError('Synthetic download failure')
+        return super().download(tickers, start_date)
+
+@pytest.fixture
+def company_list(workspace):
+    pd.DataFrame({'Symbol': TICKERS}).to_csv('Company lists/companylist_X.tsv', sep='\t')
+    return TICKERS
+
+def _ledger():
+    return pd.read_csv('Company lists/failedlist_X.tsv', sep='\t')
+
+def test_retries_with_backoff(company_list):
+    sink = dmf.MemorySink()
+    with dmf.metrics_sink(sink):
+        prices = dmf.fetch_prices('X', START, dmf.SyntheticProvider(fail_rate=0.5, seed=3), batch_size=3,
+                                  max_workers=1, retries=20, backoff=0)
+    expected = dmf.SyntheticProvider(seed=3).download(TICKERS, START)
+    pd.testing.assert_frame_equal(prices, expected, check_freq=False)
+    records = sink.to_frame()
+    attempts = records.attempts[records.span == 'fetch_prices/fetch_batch']
+    assert len(attempts) == 4 and attempts.max() > 1
+
+def test_failed_batches_raise_and_resume(company_list):
+    flaky = CountingProvider(fail_tickers=['T4'])
+    with pytest.raises(RuntimeError):
+        dmf.fetch_prices('X', START, flaky, batch_size=3, max_workers=1, retries=2, backoff=0)
+    #the failed batch was retried, the others were checkpointed
+    assert flaky.batches.count(['T3', 'T4', 'T5']) == 3
+    assert len(os.listdir(os.path.join(dmf.PRICE_DB_DIR, 'fetch_X'))) == 1 + 3
+    failed = _ledger()
+    assert sorted(failed.Symbol[failed.Reason.str.startswith('Batch failed')]) == ['T3', 'T4', 'T5']
+
+    #rerunning only downloads the failed batch
+    provider = CountingProvider()
+    prices = dmf.fetch_prices('X', START, provider, batch_size=3, max_workers=1, backoff=0)
+    assert provider.batches == [['T3', 'T4', 'T5']]
+    assert list(prices.columns) == TICKERS and prices.notna().all().all()
+
+    #a fetch from another start date doesn't resume the checkpoint
+    provider = CountingProvider()
+    dmf.fetch_prices('X', '2020-01-01', provider, batch_size=3, max_workers=1)
+    assert len(provider.batches) == 4
+
+def test_ledger_is_appended(company_list):
+    dmf.fetch_prices('X', START, dmf.SyntheticProvider(missing=['T1']), batch_size=5)
+    dmf.clear_fetch_checkpoint('X')
+    dmf.fetch_prices('X', START, dmf.SyntheticProvider(missing=['T1', 'T7']), batch_size=5)
+    failed = _ledger()
+    assert failed.Fetch_time.nunique() == 2
+    assert (failed.Reason == 'No data found').all()
+    assert failed.groupby('Fetch_time').Symbol.apply(sorted).tolist() == [['T1'], ['T1', 'T7']]
+
+def test_update_db_writes_nothing_when_a_batch_fails(company_list, monkeypatch):
+    #update_db retries with the default backoff
+    monkeypatch.setattr(dmf.fetch.time, 'sleep', lambda seconds: None)
+    dmf.write_store(dmf.SyntheticProvider().download(TICKERS, START).iloc[:-20], 'X')
+    manifest = dmf.read_store_manifest('X')
+    with pytest.raises(RuntimeError):
+        dmf.update_db('X', provider=CountingProvider(fail_tickers=['T0'], seed=0))
+    assert dmf.read_store_manifest('X') == manifest
+
+    dmf.update_db('X', provider=dmf.SyntheticProvider())
+    assert dmf.read_store_manifest('X')['version'] == manifest['version'] + 1
+    assert not os.path.exists(os.path.join(dmf.PRICE_DB_DIR, 'fetch_X'))
+    stored = dmf.load_store('X')
+    expected = dmf.SyntheticProvider().download(TICKERS, START).loc[:stored.index[-1]]
+    pd.testing.assert_frame_equal(stored, expected, check_freq=False)
+
+def test_clean_company_list_from_ledger(company_list):
+    history = dmf.SyntheticProvider(missing=['T2']).download(TICKERS, START).iloc[:-20]
+    dmf.write_store(history, 'X')
+    #T9 has stored history but no rows in the update, only T2 never had data
+    dmf.update_db('X', provider=dmf.SyntheticProvider(missing=['T2', 'T9']))
+    assert sorted(_ledger().Symbol) == ['T2', 'T9']
+    dmf.cleanCompanyList('X', use_ledger=True)
+    assert dmf.getTickers('X') == [t for t in TICKERS if t != 'T2']
@@ -0,0 +1,42 @@
+#Spans opened on other threads & in worker processes are recorded under the span which started them
+import threading
+
+import DatabaseMainFnc as dmf
+from conftest import synthetic_prices
+
+WINDOW = ('2015-01-01', '2016-01-01')
+
+def test_child_spans_on_other_threads():
+    with dmf.metrics_sink() as sink:
+        with dmf.span('outer'):
+            parent = dmf.current_span()
+            def work():
+                with dmf.child_spans(parent):
+                    with dmf.span('inner'):
+                        pass
+                with dmf.span('orphan'):
+                    pass
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+    assert sorted(record['span'] for record in sink.records) == ['orphan', 'outer', 'outer/inner']
+
+def test_worker_process_spans():
+    prices = synthetic_prices(n_dates=700, n_tickers=20, seed=7)
+    grid = {'obj_method': ['SHARPE', 'MIN_VOL'], 'asset_len': [8, 10]}
+    for n_jobs in [1, 2]:
+        with dmf.metrics_sink() as sink:
+            dmf.run_grid(prices, *WINDOW, grid, n_jobs=n_jobs)
+            dmf.efficient_frontier_sweep(prices, *WINDOW, [0.2, 0.25, 0.3, 0.35], n_jobs=n_jobs)
+        spans = sink.to_frame()['span']
+        assert (spans == 'run_grid/optimise').sum() == 4
+        assert (spans == 'efficient_frontier_sweep/solve').sum() == 4
+        assert not spans.isin(['optimise', 'solve']).any()
+
+def test_walk_forward_worker_spans():
+    prices = synthetic_prices(n_dates=900, n_tickers=20, seed=7)
+    schedule = dmf.walk_forward_schedule('2015-01-01', '2016-06-01', window_years=1, step_months=3)
+    with dmf.metrics_sink() as sink:
+        dmf.run_walk_forward(prices, schedule, n_jobs=2)
+    spans = sink.to_frame()['span']
+    assert (spans == 'run_walk_forward/portfolio_generate_test').sum() == len(schedule)
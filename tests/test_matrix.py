@@ -0,0 +1,49 @@
+#The memory-mapped price matrix & its availability index must track the price store
+import os
+
+import numpy as np
+import pandas as pd
+
+import DatabaseMainFnc as dmf
+from conftest import synthetic_prices
+
+def test_matrix_appends_and_rebuilds(workspace):
+    prices = synthetic_prices(n_dates=500, n_tickers=6)
+    dmf.write_store(prices.iloc[:400], 'X')
+    dmf.build_price_matrix('X')
+    dmf.append_to_store(prices.iloc[400:], 'X')
+    dmf.build_price_matrix('X')
+    matrix = dmf.PriceMatrix('X')
+    pd.testing.assert_frame_equal(matrix.window(), prices.astype('float32'), check_freq=False)
+
+    #a new ticker forces a rebuild
+    dmf.write_store(prices.assign(NEW=1.0), 'X')
+    dmf.build_price_matrix('X')
+    matrix = dmf.PriceMatrix('X')
+    assert matrix.tickers[-1] == 'NEW'
+    np.testing.assert_array_equal(matrix.dates, prices.index.values.astype('datetime64[D]'))
+    assert not [f for f in os.listdir(dmf.PRICE_DB_DIR) if f.endswith('.tmp')]
+
+def test_availability_index_updates_incrementally(workspace):
+    prices = synthetic_prices(n_dates=700, n_tickers=8, seed=5)
+    dmf.write_store(prices.iloc[:450], 'X')
+    dmf.open_price_matrix('X')
+    dmf.append_to_store(prices.iloc[450:], 'X')
+    matrix = dmf.open_price_matrix('X')
+    index = matrix.availability()
+    assert index.version == matrix.version
+    counts = np.vstack([np.zeros((1, 8), dtype='int32'), np.cumsum(prices.notna().to_numpy(), axis=0)])
+    np.testing.assert_array_equal(index.valid_counts, counts)
+    np.testing.assert_array_equal(index.valid_rows(100, 400), prices.iloc[100:400].notna().sum().to_numpy())
+
+def test_indexed_screen_matches_dataframe_screen(workspace):
+    prices = synthetic_prices(n_dates=700, n_tickers=20, seed=6)
+    prices.iloc[-1, :5] = 100
+    prices.iloc[-1, 5] = np.nan
+    dmf.write_store(prices, 'X')
+    matrix = dmf.open_price_matrix('X')
+    for startdate, enddate in [('2015-01-01', '2016-01-01'), ('2015-06-01', '2017-06-01')]:
+        indexed = dmf.screen_universe(matrix, startdate, enddate, p_max=50, min_returns=-0.5)
+        scanned = dmf.screen_universe(prices.astype('float32'), startdate, enddate, p_max=50, min_returns=-0.5)
+        assert list(indexed.columns) == list(scanned.columns)
+        assert 'T0' not in indexed.columns and 'T5' in indexed.columns
@@ -0,0 +1,53 @@
+#The compiled ParametricFrontier must solve each objective as pypfopt's EfficientFrontier does
+import numpy as np
+import pytest
+from pypfopt import expected_returns, risk_models
+
+import DatabaseMainFnc as dmf
+from DatabaseMainFnc import optimisation
+from conftest import synthetic_prices
+
+#windows of the same tickers & size so one compiled frontier is reused, each warm-started from the last
+WINDOWS = [('2015-01-01', '2016-01-01'), ('2015-04-01', '2016-04-01'), ('2015-07-01', '2016-07-01'),
+           ('2016-01-01', '2017-01-01'), ('2016-07-01', '2017-07-01')]
+
+def _moments(prices, startdate, enddate):
+    window = prices.loc[startdate:enddate]
+    return expected_returns.mean_historical_return(window), risk_models.sample_cov(window)
+
+def _targets(mu, S):
+    """A feasible target volatility & return for the window"""
+    ef, _ = dmf.optimise_portfolio(mu, S, 'MIN_VOL')
+    min_return, min_volatility, _ = ef.portfolio_performance()
+    return 1.2 * min_volatility, float((min_return + mu.max()) / 2)
+
+@pytest.mark.parametrize('obj_method', ['SHARPE', 'MIN_VOL', 'RISK', 'RETURN'])
+def test_parametric_matches_efficient_frontier(obj_method):
+    prices = synthetic_prices(n_dates=800, n_tickers=10, seed=4)
+    optimisation._PARAMETRIC_FRONTIERS.clear()
+    problems = set()
+    for startdate, enddate in WINDOWS:
+        mu, S = _moments(prices, startdate, enddate)
+        target_risk, target_return = _targets(mu, S)
+        target_percent = {'RISK': target_risk, 'RETURN': target_return}.get(obj_method, 0.1)
+
+        ef, summary = dmf.optimise_portfolio(mu, S, obj_method, target_percent, 'PYPFOPT')
+        pf, pf_summary = dmf.optimise_portfolio(mu, S, obj_method, target_percent, 'PARAMETRIC')
+        assert isinstance(pf, dmf.ParametricFrontier) and pf_summary == summary
+        assert list(pf.clean_weights()) == list(ef.clean_weights())
+        np.testing.assert_allclose(list(pf.clean_weights().values()), list(ef.clean_weights().values()),
+                                   rtol=0, atol=1e-4)
+        np.testing.assert_allclose(pf.portfolio_performance(), ef.portfolio_performance(), rtol=1e-4, atol=1e-6)
+        problems.add(id(pf._problem(obj_method)))
+
+    #every window re-used the problem compiled for the first
+    assert list(optimisation._PARAMETRIC_FRONTIERS) == [10]
+    assert len(problems) == 1
+
+def test_parametric_rejects_infeasible_targets():
+    prices = synthetic_prices(n_dates=800, n_tickers=10, seed=4)
+    mu, S = _moments(prices, *WINDOWS[0])
+    with pytest.raises(ValueError):
+        dmf.optimise_portfolio(mu, S, 'RISK', 0.0001, 'PARAMETRIC')
+    with pytest.raises(ValueError):
+        dmf.optimise_portfolio(mu, S, 'RETURN', float(mu.max()) + 0.1, 'PARAMETRIC')
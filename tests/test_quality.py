@@ -0,0 +1,62 @@
+#The quality flags of a chunked scan, an incremental index & a single pass must all agree
+import numpy as np
+import pandas as pd
+import pytest
+
+import DatabaseMainFnc as dmf
+from conftest import synthetic_prices
+
+nan = np.nan
+#a column per flag, stale_run=3 & jump_ratio=1.8
+PRICES = pd.DataFrame({'negative': [1, -1, 2, 3, 4],
+                       'zero': [1, 0, 1, 1.2, 1.4],
+                       'stale': [1, 1, nan, 1, 1.5],
+                       'jump': [10, 20, 10.5, 11, 12],
+                       'gap': [nan, 1, nan, nan, 1.1]}, 
+                      index=pd.bdate_range('2020-01-01', periods=5, name='Date'))
+MASK = {'negative': [0, 1, 0, 0, 0],
+        'zero': [0, 2, 0, 0, 0],
+        #missing rows don't break a run, but are a gap
+        'stale': [0, 0, 16, 4, 0],
+        'jump': [0, 8, 8, 0, 0],
+        #missing prices before the first are not a gap
+        'gap': [0, 0, 16, 16, 0]}
+
+@pytest.mark.parametrize('chunk_rows', [1, 2, 4096])
+def test_each_flag(chunk_rows):
+    mask, summary = dmf.scan_quality(PRICES, stale_run=3, jump_ratio=1.8, chunk_rows=chunk_rows)
+    pd.testing.assert_frame_equal(mask, pd.DataFrame(MASK, index=PRICES.index, dtype='uint8'))
+    counts = {'negative': [1, 0, 0, 0, 0], 'zero': [0, 1, 0, 0, 0], 'stale': [0, 0, 1, 0, 0],
+              'jump': [0, 0, 0, 2, 0], 'gap': [0, 0, 1, 0, 2], 'gaps': [0, 0, 1, 0, 1]}
+    for column, expected in counts.items():
+        assert summary[column].tolist() == expected, column
+    assert summary['last_price'].tolist() == [4, 1.4, 1.5, 12, 1.1]
+
+def test_chunked_scan_matches_single_pass():
+    prices = synthetic_prices(n_dates=600, n_tickers=10, seed=9)
+    prices.iloc[200:230, 3] = prices.iloc[199, 3]
+    prices.iloc[400:, 4] *= 3
+    mask, summary = dmf.scan_quality(prices, chunk_rows=len(prices))
+    for chunk_rows in [1, 37, 256]:
+        chunked_mask, chunked_summary = dmf.scan_quality(prices, chunk_rows=chunk_rows)
+        pd.testing.assert_frame_equal(chunked_mask, mask)
+        pd.testing.assert_frame_equal(chunked_summary, summary)
+    assert summary.loc['T3', 'stale'] > 0 and summary.loc['T4', 'jump'] > 0
+
+def test_incremental_index_matches_full_scan(workspace):
+    prices = synthetic_prices(n_dates=900, n_tickers=10, seed=9)
+    prices.iloc[500:540, 2] = prices.iloc[499, 2]
+    prices.iloc[600:, 5] /= 4
+    prices.iloc[700, 6] = 0
+    dmf.write_store(prices.iloc[:520], 'X')
+    dmf.open_price_matrix('X')
+    #an update scanned on from the saved state, part way through a stale run
+    dmf.append_to_store(prices.iloc[520:], 'X')
+    dmf.build_price_matrix('X')
+    dmf.build_quality_index('X', chunk_rows=64)
+    quality = dmf.DataQuality('X')
+
+    mask, summary = dmf.scan_quality(prices.astype('float32'))
+    np.testing.assert_array_equal(quality.mask, mask.to_numpy())
+    pd.testing.assert_frame_equal(quality.summary(), summary, check_names=False)
+    assert (summary.loc[['T2', 'T5', 'T6'], ['stale', 'jump', 'zero']].to_numpy().diagonal() > 0).all()
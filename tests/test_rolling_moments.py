@@ -0,0 +1,72 @@
+#RollingMoments must agree with pypfopt's estimators as its window slides
+import pandas as pd
+import pytest
+from pypfopt import expected_returns, risk_models
+
+import DatabaseMainFnc as dmf
+from conftest import synthetic_prices
+
+#forward slides, a backward slide, a grow, a shrink & a jump with no overlap
+WINDOWS = [('2015-03-02', '2016-03-01'), ('2015-03-09', '2016-03-08'), ('2015-04-06', '2016-04-05'),
+           ('2015-03-20', '2016-03-18'), ('2015-03-20', '2016-09-01'), ('2015-06-01', '2016-06-01'),
+           ('2017-01-02', '2017-06-30')]
+
+def test_matches_pypfopt_as_window_slides():
+    prices = synthetic_prices()
+    rm = dmf.RollingMoments(prices)
+    for startdate, enddate in WINDOWS:
+        window = prices.loc[startdate:enddate]
+        rm.window(startdate, enddate)
+        pd.testing.assert_series_equal(rm.mean_historical_return(),
+                                       expected_returns.mean_historical_return(window), rtol=1e-10, check_names=False)
+        pd.testing.assert_series_equal(rm.mean_historical_return(compounding=False),
+                                       expected_returns.mean_historical_return(window, compounding=False),
+                                       rtol=1e-10, check_names=False)
+        pd.testing.assert_frame_equal(rm.sample_cov(), risk_models.sample_cov(window), rtol=1e-10)
+
+def test_log_returns_match_pypfopt():
+    prices = synthetic_prices(seed=1)
+    rm = dmf.RollingMoments(prices, log_returns=True)
+    for startdate, enddate in WINDOWS[:3]:
+        window = prices.loc[startdate:enddate]
+        rm.window(startdate, enddate)
+        pd.testing.assert_series_equal(rm.mean_historical_return(),
+                                       expected_returns.mean_historical_return(window, log_returns=True),
+                                       rtol=1e-10, check_names=False)
+        pd.testing.assert_frame_equal(rm.sample_cov(), risk_models.sample_cov(window, log_returns=True), rtol=1e-10)
+
+def test_ticker_subsets():
+    prices = synthetic_prices(seed=2)
+    tickers = ['T5', 'T1', 'T0']
+    rm = dmf.RollingMoments(prices).window(*WINDOWS[1])
+    window = prices.loc[WINDOWS[1][0]:WINDOWS[1][1], tickers]
+    pd.testing.assert_series_equal(rm.mean_historical_return(tickers=tickers),
+                                   expected_returns.mean_historical_return(window), rtol=1e-10, check_names=False)
+    pd.testing.assert_frame_equal(rm.sample_cov(tickers=tickers), risk_models.sample_cov(window), rtol=1e-10)
+    with pytest.raises(KeyError):
+        rm.sample_cov(tickers=['NOPE'])
+
+@pytest.fixture
+def price_matrix(workspace):
+    dmf.write_store(synthetic_prices(n_dates=900, n_tickers=30, seed=3), 'TEST')
+    return dmf.open_price_matrix('TEST')
+
+def test_price_matrix_matches_pypfopt(price_matrix):
+    rm = dmf.RollingMoments(price_matrix)
+    for startdate, enddate in WINDOWS:
+        window = price_matrix.window(startdate, enddate)
+        rm.window(startdate, enddate)
+        #pypfopt compounds the float32 prices' returns in float32
+        pd.testing.assert_series_equal(rm.mean_historical_return(),
+                                       expected_returns.mean_historical_return(window).astype('float64'),
+                                       rtol=0, atol=1e-5, check_names=False)
+        pd.testing.assert_frame_equal(rm.sample_cov(), risk_models.sample_cov(window), rtol=1e-8)
+
+def test_rolling_walk_forward_matches_scratch(price_matrix):
+    schedule = dmf.walk_forward_schedule('2015-02-01', '2016-06-01', window_years=1, step_months=3)
+    configs = [{'asset_len': 10}, {'asset_len': 10, 'obj_method': 'MIN_VOL'}]
+    rolling = dmf.run_walk_forward(price_matrix, schedule, configs, n_jobs=1)
+    scratch = dmf.run_walk_forward(price_matrix, schedule, configs, n_jobs=1, rolling=False)
+    assert rolling['error'].isna().all()
+    columns = ['expected_returns', 'volatility', 'sharpe', 'actual_returns', 'mean_returns']
+    pd.testing.assert_frame_equal(rolling[columns], scratch[columns], atol=1e-4)
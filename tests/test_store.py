@@ -0,0 +1,77 @@
+#The price store's one time CSV migration, appends & rewrites
+import os
+
+import numpy as np
+import pandas as pd
+
+import DatabaseMainFnc as dmf
+from conftest import synthetic_prices
+
+def _store_files(exchange):
+    return sorted(os.listdir(os.path.join(dmf.PRICE_DB_DIR, 'store_'+exchange)))
+
+def test_csv_migrated_once_by_connect(workspace):
+    prices = synthetic_prices(n_dates=400, n_tickers=5)
+    csv = prices.copy()
+    csv.index = csv.index.strftime(dmf.DATE_FORMAT)
+    csv.reset_index().to_csv(os.path.join(dmf.PRICE_DB_DIR, 'database_X.csv'), index=False)
+
+    database = dmf.connectAndLoadDb('X')
+    manifest = dmf.read_store_manifest('X')
+    assert manifest['version'] == 1
+    assert manifest['last_date'] == csv.index[-1]
+    assert [part['start'][:4] for part in manifest['partitions']] == ['2015', '2016']
+    assert list(database.columns) == ['Date'] + list(prices.columns)
+    assert database['Date'].tolist() == csv.index.tolist()
+    np.testing.assert_allclose(database[prices.columns].to_numpy(), prices.to_numpy())
+
+    #the store is read from now on, the CSV is never migrated again
+    os.remove(os.path.join(dmf.PRICE_DB_DIR, 'database_X.csv'))
+    pd.testing.assert_frame_equal(dmf.connectAndLoadDb('X'), database)
+    assert dmf.read_store_manifest('X')['version'] == 1
+
+def test_append_keeps_only_rows_after_last_date(workspace):
+    prices = synthetic_prices(n_dates=300, n_tickers=4)
+    dmf.write_store(prices.iloc[:200], 'X')
+
+    #an update overlapping the stored history must not rewrite it
+    update = prices.iloc[180:260] * 2
+    assert dmf.append_to_store(update, 'X') == 60
+    manifest = dmf.read_store_manifest('X')
+    assert manifest['version'] == 2
+    assert manifest['last_date'] == dmf.prettyPrintDate(prices.index[259])
+    assert manifest['partitions'][-1]['rows'] == 60
+
+    stored = dmf.load_store('X')
+    expected = pd.concat([prices.iloc[:200], update.iloc[20:]])
+    pd.testing.assert_frame_equal(stored, expected, check_freq=False)
+
+    #nothing new, nothing written
+    assert dmf.append_to_store(update, 'X') == 0
+    assert dmf.read_store_manifest('X') == manifest
+
+def test_write_and_compact_replace_partitions(workspace):
+    prices = synthetic_prices(n_dates=600, n_tickers=4)
+    dmf.write_store(prices.iloc[:400], 'X')
+    first = dmf.read_store_manifest('X')
+    for start in range(400, 600, 50):
+        dmf.append_to_store(prices.iloc[start:start+50], 'X')
+    appended = dmf.read_store_manifest('X')
+    assert len(appended['partitions']) == len(first['partitions']) + 4
+    assert appended['version'] == first['version'] + 4
+
+    dmf.compact_store('X')
+    compacted = dmf.read_store_manifest('X')
+    assert compacted['version'] == appended['version'] + 1
+    assert [part['start'][:4] for part in compacted['partitions']] == ['2015', '2016', '2017']
+    #new partitions never reuse the names of those they replace
+    assert compacted['next_partition'] == appended['next_partition'] + 3
+    assert not {part['file'] for part in compacted['partitions']} & {part['file'] for part in appended['partitions']}
+    assert _store_files('X') == sorted(['manifest.json'] + [part['file'] for part in compacted['partitions']])
+    pd.testing.assert_frame_equal(dmf.load_store('X'), prices, check_freq=False)
+
+    dmf.write_store(prices.iloc[:100], 'X', partition_by=None)
+    rewritten = dmf.read_store_manifest('X')
+    assert len(rewritten['partitions']) == 1
+    assert rewritten['last_date'] == dmf.prettyPrintDate(prices.index[99])
+    assert _store_files('X') == ['manifest.json', rewritten['partitions'][0]['file']]